@@ -1,9 +1,9 @@
 import streamlit as st
 import pandas as pd
-import altair as alt
 import database 
-from datetime import date
-import time
+import instrumentation
+import running_analytics
+from datetime import date, datetime
 
 st.set_page_config(page_title="Training Panel PRO", layout="wide", initial_sidebar_state="expanded")
 
@@ -52,10 +52,16 @@ if not st.session_state['logged_in']:
                 if input_password == correct_pass:
                     st.session_state['logged_in'] = True
                     st.session_state['current_user'] = selected_user
-                    st.session_state['db_url'] = st.secrets["db_urls"][selected_user]
-                    
-                    st.success("Logged in! Loading...")
-                    time.sleep(0.5)
+                    shared_db_url = st.secrets.get("shared_db_url")
+                    st.session_state['db_url'] = shared_db_url or st.secrets["db_urls"][selected_user]
+                    st.session_state['user_id'] = selected_user if shared_db_url else ""
+                    st.session_state['write_behind'] = bool(st.secrets.get("write_behind", False))
+                    st.session_state['local_snapshot'] = bool(st.secrets.get("local_snapshot", False))
+                    st.session_state['compact_logs'] = bool(st.secrets.get("compact_logs", False))
+                    st.session_state['listen_changes'] = bool(st.secrets.get("listen_changes", False))
+                    st.session_state['live_refresh_s'] = st.secrets.get("live_refresh_s")
+                    st.session_state['debug_panel'] = bool(st.secrets.get("debug_panel", False))
+                    st.session_state['query_timeout'] = st.secrets.get("query_timeout_ms", database.QUERY_TIMEOUT * 1000) / 1000
                     st.rerun()
                 else:
                     st.error("Invalid password!")
@@ -66,54 +72,46 @@ if not st.session_state['logged_in']:
     
     st.stop()
 
+instrumentation.configure(st.secrets.get("slow_query_ms"), st.secrets.get("slow_query_log"), st.secrets.get("metrics_file"))
+instrumentation.start_trace()
 database.init_db()
+database.sync_local_snapshot()
+if st.session_state.get('compact_logs'): database.start_log_compaction()
+if st.session_state.get('listen_changes'): database.start_change_listener()
+st.session_state['seen_change_version'] = database.change_version()
+snapshot_status = database.get_snapshot_status()
+READ_ONLY = bool(snapshot_status["last_error"])
+LOGS_LOCKED = READ_ONLY and not st.session_state.get('write_behind')
+if READ_ONLY:
+    synced = datetime.fromtimestamp(snapshot_status["synced_at"]).strftime("%Y-%m-%d %H:%M")
+    st.warning(f"📴 Database unreachable, showing the local copy from {synced}. Editing is disabled until it reconnects.")
+
+ACTIVITIES = database.get_activity_structure()
+STRUCTURE = ACTIVITIES.categories
 
-def climbing_sort_key(val):
-    order = ["3", "4", "5", "5+", "6a", "6a+", "6b", "6b+", "6c", "6c+", "7a", "7a+", "7b", "7b+", "7c", "7c+", "8a", "8a+", "8b", "8b+", "8c", "9a"]
-    val_lower = str(val).lower()
-    if val_lower in order: return order.index(val_lower)
-    return 999
-
-df_config = database.get_config()
-
-def get_sorted_list(category):
-    items = df_config[df_config['category'] == category]['name'].tolist()
-    if category in ["Bouldering", "Sport Climbing", "Baldy", "Liny"]: return sorted(items, key=climbing_sort_key)
-    return sorted(items)
-
-AVAILABLE_CATS = df_config['category'].unique().tolist()
-STRUCTURE = {k: get_sorted_list(k) for k in AVAILABLE_CATS}
-
-BAD_HABITS = df_config[df_config['is_bad']==1]['name'].tolist()
 AVG_METRICS = ["Running (pace)", "Bieganie (tempo)"]
 
-with st.sidebar:
-    st.title(f"Hi, {st.session_state['current_user'].upper()}! 👋")
-    
-    selected_page = st.radio(
-        "Navigate:", 
-        ["🏠 Command Center", "🏃 Running Log", "📅 Planner"],
-        label_visibility="collapsed"
-    )
-    
-    st.markdown("---")
-    
+def refresh_if_visible(category):
+    if st.session_state.get("nav_page") == "🏠 Command Center" and st.session_state.get("cc_view", "All") in ("All", category):
+        st.rerun()
+
+@st.fragment
+def render_quick_add():
     with st.expander("⚡ QUICK ADD", expanded=True):
         if not STRUCTURE:
             st.warning("No categories found.")
         else:
             cat = st.selectbox("Category", list(STRUCTURE.keys()))
             act = st.selectbox("Activity", STRUCTURE[cat])
-            
-            climbing_cats = ["Bouldering", "Sport Climbing", "Baldy", "Liny"]
-            
-            if cat in climbing_cats:
-                if st.button("DONE (+1)", type="primary", width="stretch"):
+        
+            if cat in database.CLIMBING_CATEGORIES:
+                if st.button("DONE (+1)", type="primary", width="stretch", disabled=LOGS_LOCKED):
                     database.add_log(act, 1.0)
                     st.toast(f"Saved: {act}")
+                    refresh_if_visible(cat)
             else:
                 is_float = "km" in act.lower() or "pace" in act.lower() or "tempo" in act.lower()
-                
+            
                 with st.form("quick_add_form"):
                     if is_float:
                         val_def = 5.0; step_val = 1.0; fmt = "%.2f"
@@ -121,45 +119,174 @@ with st.sidebar:
                     else:
                         val_def = 1; step_val = 1; fmt = "%d"
                         amount = st.number_input("Value", value=int(val_def), step=int(step_val), format=fmt, min_value=0)
-                    
-                    if st.form_submit_button("SAVE", type="primary", use_container_width=True):
+                
+                    if st.form_submit_button("SAVE", type="primary", use_container_width=True, disabled=LOGS_LOCKED):
                         database.add_log(act, amount)
                         st.toast(f"Saved: {act}")
+                        refresh_if_visible(cat)
+
+@st.fragment(run_every=st.session_state.get('live_refresh_s'))
+def render_live_refresh():
+    if database.change_version() != st.session_state['seen_change_version']: st.rerun()
+
+with st.sidebar:
+    st.title(f"Hi, {st.session_state['current_user'].upper()}! 👋")
+    
+    selected_page = st.radio(
+        "Navigate:", 
+        ["🏠 Command Center", "🏃 Running Log", "📅 Planner"],
+        label_visibility="collapsed", key="nav_page"
+    )
+    
+    st.markdown("---")
     
+    render_quick_add()
+    
+    if st.session_state.get('write_behind'):
+        write_status = database.get_write_status()
+        if write_status["last_error"]:
+            st.warning(f"⏳ {write_status['pending']} entries waiting to sync. Database unreachable: {write_status['last_error']}")
+        elif write_status["pending"]:
+            st.caption(f"⏳ {write_status['pending']} entries waiting to sync")
+        else:
+            st.caption("✅ All entries synced")
+
+    if st.session_state.get('listen_changes') and st.session_state.get('live_refresh_s'):
+        render_live_refresh()
+
     st.markdown("---")
     if st.button("Logout", width="stretch"):
         st.session_state['logged_in'] = False
         st.session_state['current_user'] = ""
+        st.session_state['user_id'] = ""
         st.rerun()
 
-states = database.get_weekly_state_dict()
-goals = database.get_current_goals_dict()
+snapshot = database.get_dashboard_snapshot()
+states = snapshot["state"]
+goals = snapshot["goals"]
 
-def render_altair_chart(activity_list, period, category):
-    df = database.get_chart_data(activity_list, period)
-    
-    if df.empty:
-        df_agg = pd.DataFrame(activity_list, columns=['aktywnosc']); df_agg['ilosc'] = 0
+def render_altair_chart(activity_list, period, category, start=None, end=None):
+    import altair as alt
+    if start is None and period in database.CHART_PERIODS:
+        chart = database.get_dashboard_snapshot()
+        totals, planned = chart["totals"][period], chart["planned"][period]
     else:
-        df_agg = df.groupby("aktywnosc")['ilosc'].sum().reset_index()
-    
-    df_full = pd.merge(pd.DataFrame(activity_list, columns=['aktywnosc']), df_agg, on='aktywnosc', how='left').fillna(0)
-    df_full['Goal_Hist'] = df_full['aktywnosc'].apply(lambda x: database.calc_historical_goal(x, period))
+        totals = database.get_activity_totals(activity_list, period, start, end)
+        planned = database.calc_historical_goals(activity_list, period, start, end)
+    df_full = pd.DataFrame(activity_list, columns=['aktywnosc'])
+    df_full['ilosc'] = df_full['aktywnosc'].map(totals).fillna(0)
+    df_full['Goal_Hist'] = df_full['aktywnosc'].map(planned).fillna(0)
     
     df_full.loc[df_full['aktywnosc'].str.contains("pace|tempo", case=False, na=False), 'Goal_Hist'] = 0
     
     color_bar = "#4CAF50"
-    if category in ["Bouldering", "Sport Climbing", "Baldy", "Liny"]: color_bar = "#FFC107"
-    elif any(x in BAD_HABITS for x in activity_list): color_bar = "#FF5252"
+    if category in database.CLIMBING_CATEGORIES: color_bar = "#FFC107"
+    elif category in ACTIVITIES.bad_categories: color_bar = "#FF5252"
     
     base = alt.Chart(df_full).encode(
-        x=alt.X('aktywnosc', title=None, sort=activity_list if category in ["Bouldering", "Sport Climbing"] else None),
+        x=alt.X('aktywnosc', title=None, sort=list(activity_list) if category in ["Bouldering", "Sport Climbing"] else None),
         tooltip=['aktywnosc', 'ilosc', 'Goal_Hist']
     )
     bars = base.mark_bar(color=color_bar, opacity=0.9).encode(y=alt.Y('ilosc', title='Value'))
     ticks = base.transform_filter(alt.datum.Goal_Hist > 0).mark_tick(color='white', thickness=2, size=30).encode(y='Goal_Hist')
     st.altair_chart((bars + ticks).properties(height=250), use_container_width=True)
 
+def save_card_value(act, key, old_value):
+    delta = st.session_state[key] - old_value
+    if delta != 0:
+        database.add_log(act, delta)
+        st.toast("Updated!")
+
+@st.fragment
+def render_activity_card(title, act, is_bad_habit):
+    card = database.get_dashboard_snapshot()
+    s = card["state"].get(act, 0)
+    c = card["goals"].get(act, 0)
+
+    c1, c2, c3 = st.columns([2, 4, 2])
+    c1.write(f"**{act}**")
+    
+    if act in AVG_METRICS:
+        c2.info(f"Avg: {s:.2f}")
+    else:
+        proc = min(s/c if c>0 else 0, 1.0)
+        if is_bad_habit and c>0 and s>c: c2.error("LIMIT")
+        else: c2.progress(proc)
+    
+    with c3:
+        label_btn = f"{int(s)} / {int(c)}"
+        if act in AVG_METRICS: label_btn = f"{s:.2f}"
+        key_pop = f"edit_{title}_{act}"
+        
+        with st.popover(label_btn, use_container_width=True, help="Edit value"):
+            st.write(f"Correct: **{act}**")
+            is_float = "km" in act.lower() or "pace" in act.lower() or "tempo" in act.lower()
+            
+            val = float(s) if is_float else int(s)
+            if st.session_state.get(f"base_{key_pop}") != val:
+                st.session_state[f"base_{key_pop}"] = val
+                st.session_state[f"value_{key_pop}"] = val
+            
+            with st.form(key=f"form_{key_pop}"):
+                if is_float:
+                    step = 0.5; fmt = "%.2f"
+                    st.number_input("State:", step=step, format=fmt, min_value=0.0, key=f"value_{key_pop}")
+                else:
+                    step = 1; fmt = "%d"
+                    st.number_input("State:", step=step, format=fmt, min_value=0, key=f"value_{key_pop}")
+                
+                st.form_submit_button("Confirm", use_container_width=True, on_click=save_card_value, args=(act, f"value_{key_pop}", val), disabled=LOGS_LOCKED)
+
+def render_trend_chart(activity_list, period, start=None, end=None):
+    import altair as alt
+    df = database.get_trend_series(activity_list, period, start, end)
+    if df.empty: st.caption("No data in this range."); return
+    line = alt.Chart(df).mark_line(point=True).encode(
+        x=alt.X('data:T', title=None), y=alt.Y('ilosc', title='Value'), color=alt.Color('aktywnosc', title=None),
+        tooltip=['data:T', 'aktywnosc', 'ilosc']
+    )
+    st.altair_chart(line.properties(height=250), use_container_width=True)
+
+def render_yoy_chart(activity_list, category):
+    import altair as alt
+    act = st.selectbox("Activity", activity_list, key=f"yoy_{category}")
+    df = database.get_year_over_year([act])
+    if df.empty: st.caption("No data yet."); return
+    line = alt.Chart(df).mark_line(point=True).encode(
+        x=alt.X('okres:O', title='Month'), y=alt.Y('ilosc', title='Value'), color=alt.Color('rok:N', title=None),
+        tooltip=['rok', 'okres', 'ilosc']
+    )
+    st.altair_chart(line.properties(height=250), use_container_width=True)
+
+@st.fragment
+def render_chart_expander(title, category, items_list):
+    with st.expander(f"📈 Chart: {title}"):
+        mode = st.radio("View", ["Totals", "Trend", "Year over year"], horizontal=True, key=f"m_{category}")
+        if mode == "Year over year":
+            render_yoy_chart(items_list, category)
+            return
+        periods = database.CHART_PERIODS + tuple(database.ROLLING_PERIODS) + ("Custom",)
+        period = st.selectbox("Period", periods, key=f"o_{category}")
+        start = end = None
+        if period == "Custom":
+            picked = st.date_input("Range", value=(), key=f"range_{category}")
+            if len(picked) < 2: st.caption("Pick a start and end date."); return
+            start, end = picked
+        if mode == "Trend": render_trend_chart(items_list, period, start, end)
+        else: render_altair_chart(items_list, period, category, start, end)
+
+def section_reads(category, items_list):
+    mode = st.session_state.get(f"m_{category}", "Totals")
+    if mode == "Year over year":
+        return database.chart_reads([st.session_state.get(f"yoy_{category}", items_list[0])], mode)
+    period = st.session_state.get(f"o_{category}", database.CHART_PERIODS[0])
+    start = end = None
+    if period == "Custom":
+        picked = st.session_state.get(f"range_{category}", ())
+        if len(picked) < 2: return []
+        start, end = picked
+    return database.chart_reads(items_list, mode, period, start, end)
+
 def render_simple_section(title, category, is_bad_habit=False):
     st.subheader(title)
     items_list = STRUCTURE.get(category, [])
@@ -167,80 +294,125 @@ def render_simple_section(title, category, is_bad_habit=False):
 
     has_content = False
     for act in items_list:
-        s = states.get(act, 0)
-        c = goals.get(act, 0)
-        if c == 0 and s == 0: continue
+        if goals.get(act, 0) == 0 and states.get(act, 0) == 0: continue
         has_content = True
-
-        c1, c2, c3 = st.columns([2, 4, 2])
-        c1.write(f"**{act}**")
-        
-        if act in AVG_METRICS:
-            c2.info(f"Avg: {s:.2f}")
-        else:
-            proc = min(s/c if c>0 else 0, 1.0)
-            if is_bad_habit and c>0 and s>c: c2.error("LIMIT")
-            else: c2.progress(proc)
-        
-        with c3:
-            label_btn = f"{int(s)} / {int(c)}"
-            if act in AVG_METRICS: label_btn = f"{s:.2f}"
-            key_pop = f"edit_{title}_{act}"
-            
-            with st.popover(label_btn, use_container_width=True, help="Edit value"):
-                st.write(f"Correct: **{act}**")
-                is_float = "km" in act.lower() or "pace" in act.lower() or "tempo" in act.lower()
-                
-                with st.form(key=f"form_{key_pop}"):
-                    if is_float:
-                        step = 0.5; fmt = "%.2f"; val = float(s)
-                        new_value = st.number_input("State:", value=val, step=step, format=fmt, min_value=0.0)
-                    else:
-                        step = 1; fmt = "%d"; val = int(s)
-                        new_value = st.number_input("State:", value=val, step=step, format=fmt, min_value=0)
-                    
-                    submitted = st.form_submit_button("Confirm", use_container_width=True)
-                
-                if submitted:
-                    delta = new_value - val
-                    if delta != 0:
-                        database.add_log(act, delta)
-                        st.toast("Updated!")
-                        st.rerun()
+        render_activity_card(title, act, is_bad_habit)
 
     if not has_content: st.caption("No data (0/0).")
 
-    with st.expander(f"📈 Chart: {title}"):
-        period = st.selectbox("Period", ["This Week", "This Month", "This Year"], key=f"o_{category}")
-        render_altair_chart(items_list, period, category)
-
-def handle_table_changes():
-    if "editor_runs" not in st.session_state: return
-    changes = st.session_state["editor_runs"]
+    render_chart_expander(title, category, items_list)
+
+def handle_table_changes(editor_key):
+    if editor_key not in st.session_state: return
+    changes = st.session_state[editor_key]
+    errors = database.apply_run_changes(changes, st.session_state["runs_rows"])
+    for message in errors: st.toast(f"⚠️ {message}")
+    if errors: return
+
+    if changes["deleted_rows"]: st.toast("🗑️ Run deleted!")
+    if changes["edited_rows"]: st.toast("✏️ Updated!")
+    if changes["added_rows"]: st.toast("🏃 Run added!")
+
+def save_planner_changes(cat_filter):
+    if "editor_planner" not in st.session_state: return
+    changes = st.session_state["editor_planner"]
+    for row in changes["added_rows"]:
+        current_cat = row.get("Category")
+        if (not current_cat or str(current_cat).strip() == "") and cat_filter != "All Categories":
+            row["Category"] = cat_filter
+
+    if not (changes["edited_rows"] or changes["deleted_rows"] or changes["added_rows"]):
+        st.session_state["planner_result"] = "unchanged"
+        return
+    errors = database.update_planner_batch(changes, st.session_state["plan_rows"])
+    st.session_state["planner_result"] = errors or "saved"
+
+def render_run_analytics():
+    import altair as alt
+    stats = running_analytics.get_running_analytics()
+    if not stats["runs"]: return
+    st.subheader("Analytics")
+    m1, m2, m3, m4, m5 = st.columns(5)
+    m1.metric("Last 7 days", f"{stats['acute_km']:.1f} km")
+    m2.metric("Last 28 days", f"{stats['chronic_km']:.1f} km")
+    m3.metric("Acute:chronic", "–" if stats["acwr"] is None else f"{stats['acwr']:.2f}")
+    m4.metric("Current streak", f"{stats['streaks']['current']} days")
+    m5.metric("Longest streak", f"{stats['streaks']['longest']} days")
+
+    a1, a2, a3 = st.columns([2, 2, 1], gap="large")
+    with a1:
+        st.caption("Rolling mileage (km)")
+        mileage = stats["mileage"][["date", "acute", "chronic"]].melt(id_vars="date", value_vars=["acute", "chronic"], var_name="window", value_name="km")
+        mileage["window"] = mileage["window"].map({"acute": "7 days", "chronic": "28 days"})
+        st.altair_chart(alt.Chart(mileage).mark_line().encode(x=alt.X('date:T', title=None), y='km', color=alt.Color('window', title=None))
+                        .properties(height=220), use_container_width=True)
+    with a2:
+        st.caption("Weekly pace (min/km)")
+        pace = alt.Chart(stats["weekly_pace"]).encode(x=alt.X('week:T', title=None))
+        st.altair_chart((pace.mark_circle(opacity=0.5).encode(y=alt.Y('pace', scale=alt.Scale(zero=False)), tooltip=['week:T', 'pace', 'km'])
+                         + pace.mark_line(color="#4CAF50").encode(y='trend')).properties(height=220), use_container_width=True)
+    with a3:
+        st.caption("Personal bests")
+        bests = stats["bests"].assign(time=lambda df: df["minutes"].map(lambda m: f"{int(m // 60)}:{int(m % 60):02d}:{int(m * 60 % 60):02d}"))
+        st.dataframe(bests[["bracket", "time", "pace", "date"]], hide_index=True, use_container_width=True,
+                     column_config={"pace": st.column_config.NumberColumn("Pace", format="%.2f")})
+
+@st.fragment
+def render_run_history():
+    import altair as alt
+    st.subheader("History")
+    f1, f2 = st.columns([3, 1])
+    date_range = f1.date_input("Date range", value=(), key="runs_range")
+    page_size = f2.selectbox("Rows", [25, 50, 100], index=1, key="runs_page_size")
+    start = date_range[0] if len(date_range) > 0 else None
+    end = date_range[1] if len(date_range) > 1 else None
+
+    database.prefetch([(database.get_run_chart_series, start, end)])
+    runs_query = (start, end, page_size)
+    if st.session_state.get("runs_query") != runs_query:
+        st.session_state["runs_query"] = runs_query
+        st.session_state["runs_cursors"] = [None]
+    cursors = st.session_state["runs_cursors"]
+
+    df_runs, next_cursor = database.get_run_page(cursors[-1], page_size, start, end)
+    if not df_runs.empty and 'date' in df_runs.columns: df_runs['date'] = pd.to_datetime(df_runs['date']).dt.date
+    st.session_state["runs_rows"] = database.run_rows(df_runs)
     
-    for idx in changes["deleted_rows"]:
-        id_to_del = st.session_state["df_runs_snapshot"].iloc[idx]['id']
-        database.delete_run(int(id_to_del))
-        st.toast("🗑️ Run deleted!")
-
-    for idx, row_changes in changes["edited_rows"].items():
-        run_id = st.session_state["df_runs_snapshot"].iloc[idx]['id']
-        for col_name, new_val in row_changes.items():
-            database.update_run(int(run_id), col_name, new_val)
-        st.toast("✏️ Updated!")
-
-    for new_row in changes["added_rows"]:
-        dist = new_row.get("distance", 0); t_min = new_row.get("time_min", 0)
-        d = new_row.get("date", str(date.today())); note = new_row.get("note", "")
-        if dist > 0 and t_min > 0:
-            database.add_run(dist, t_min, note, d)
-            st.toast("🏃 Run added!")
+    if not df_runs.empty:
+        df_chart = database.get_run_chart_series(start, end)
+        scatter = alt.Chart(df_chart).mark_circle(size=100).encode(
+            x='date:T', y='pace', color='distance', tooltip=['date', 'note']
+        ).interactive()
+        st.altair_chart(scatter, use_container_width=True)
+        
+        edit_mode = st.toggle("✏️ Enable Editing", value=False, disabled=READ_ONLY)
+        editor_key = f"editor_runs_{len(cursors)}_{start}_{end}_{page_size}"
+        st.data_editor(
+            df_runs, key=editor_key, on_change=handle_table_changes, args=(editor_key,),
+            num_rows="dynamic" if edit_mode else "fixed", hide_index=True, use_container_width=True,
+            column_config={
+                "id": st.column_config.NumberColumn(disabled=True),
+                "pace": st.column_config.NumberColumn("Pace", format="%.2f", disabled=True),
+                "date": st.column_config.DateColumn("Date", disabled=not edit_mode),
+                "distance": st.column_config.NumberColumn("km", format="%.2f", step=0.1, disabled=not edit_mode, min_value=0.0),
+                "time_min": st.column_config.NumberColumn("min", format="%d", step=1, disabled=not edit_mode, min_value=0),
+                "note": st.column_config.TextColumn("Note", disabled=not edit_mode)
+            }
+        )
+
+        p1, p2, p3 = st.columns([1, 2, 1])
+        p1.button("◀ Newer", disabled=len(cursors) == 1, on_click=cursors.pop, width="stretch")
+        p2.caption(f"Page {len(cursors)}")
+        p3.button("Older ▶", disabled=next_cursor is None, on_click=cursors.append, args=(next_cursor,), width="stretch")
+    else: st.info("No runs found.")
 
 if selected_page == "🏠 Command Center":
     st.title("Command Center")
     view_options = ["All"] + list(STRUCTURE.keys())
-    view = st.radio("Show:", view_options, horizontal=True)
+    view = st.radio("Show:", view_options, horizontal=True, key="cc_view")
     st.markdown("---")
+    visible = list(STRUCTURE.keys()) if view == "All" else [view]
+    database.prefetch([read for cat in visible if STRUCTURE[cat] for read in section_reads(cat, STRUCTURE[cat])])
 
     if view == "All":
         cats = list(STRUCTURE.keys())
@@ -249,15 +421,16 @@ if selected_page == "🏠 Command Center":
             for j in range(3):
                 if i + j < len(cats):
                     cat_name = cats[i + j]
-                    is_bad = any(x in BAD_HABITS for x in STRUCTURE[cat_name])
+                    is_bad = cat_name in ACTIVITIES.bad_categories
                     with cols[j]: render_simple_section(cat_name, cat_name, is_bad_habit=is_bad)
             if i + 3 < len(cats): st.markdown("<br>", unsafe_allow_html=True)
     else:
-        is_bad = any(x in BAD_HABITS for x in STRUCTURE[view])
+        is_bad = view in ACTIVITIES.bad_categories
         render_simple_section(view, view, is_bad_habit=is_bad)
 
 elif selected_page == "🏃 Running Log":
     st.title("🏃 Running Log")
+    database.prefetch([(running_analytics.get_running_analytics,)])
     col_add, col_list = st.columns([1, 2], gap="large")
     with col_add:
         st.success("Add New Run")
@@ -266,34 +439,13 @@ elif selected_page == "🏃 Running Log":
             km = st.number_input("Distance (km)", value=5.0, step=1.0, min_value=0.0)
             t = st.number_input("Time (min)", value=30.0, step=1.0, min_value=0.0)
             n = st.text_input("Note")
-            if st.form_submit_button("SAVE RUN", width="stretch"):
+            if st.form_submit_button("SAVE RUN", width="stretch", disabled=READ_ONLY):
                 database.add_run(km, t, n, d); st.rerun()
     with col_list:
-        st.subheader("History")
-        df_runs = database.get_run_history()
-        if not df_runs.empty and 'date' in df_runs.columns: df_runs['date'] = pd.to_datetime(df_runs['date']).dt.date
-        st.session_state["df_runs_snapshot"] = df_runs
-        
-        if not df_runs.empty:
-            scatter = alt.Chart(df_runs).mark_circle(size=100).encode(
-                x='date', y='pace', color='distance', tooltip=['date', 'note']
-            ).interactive()
-            st.altair_chart(scatter, use_container_width=True)
-            
-            edit_mode = st.toggle("✏️ Enable Editing", value=False)
-            st.data_editor(
-                df_runs, key="editor_runs", on_change=handle_table_changes,
-                num_rows="dynamic" if edit_mode else "fixed", hide_index=True, use_container_width=True,
-                column_config={
-                    "id": st.column_config.NumberColumn(disabled=True),
-                    "pace": st.column_config.NumberColumn("Pace", format="%.2f", disabled=True),
-                    "date": st.column_config.DateColumn("Date", disabled=not edit_mode),
-                    "distance": st.column_config.NumberColumn("km", format="%.2f", step=0.1, disabled=not edit_mode, min_value=0.0),
-                    "time_min": st.column_config.NumberColumn("min", format="%d", step=1, disabled=not edit_mode, min_value=0),
-                    "note": st.column_config.TextColumn("Note", disabled=not edit_mode)
-                }
-            )
-        else: st.info("No runs found.")
+        render_run_history()
+
+    st.markdown("---")
+    render_run_analytics()
 
 elif selected_page == "📅 Planner":
     st.title("📅 Planner")
@@ -320,11 +472,10 @@ elif selected_page == "📅 Planner":
             with tab2:
                 cat_to_rename = st.selectbox("Select Category to Rename", db_cats)
                 new_name_rename = st.text_input("New Name")
-                if st.button("Rename Category", key="btn_rename_cat"):
+                if st.button("Rename Category", key="btn_rename_cat", disabled=READ_ONLY):
                     if new_name_rename and cat_to_rename:
                         database.rename_category_in_db(cat_to_rename, new_name_rename)
-                        st.success("Renamed!")
-                        time.sleep(1)
+                        st.toast("Renamed!")
                         st.rerun()
 
             with tab3:
@@ -344,7 +495,7 @@ elif selected_page == "📅 Planner":
         df_display = df_raw.copy()
 
     df_display = df_display.reset_index(drop=True)
-    st.session_state["df_plan_snapshot"] = df_display
+    st.session_state["plan_rows"] = database.planner_rows(df_display)
 
     st.info("💡 You can add new rows below. Use 'Manage Categories' to add/edit categories.")
     
@@ -384,22 +535,19 @@ elif selected_page == "📅 Planner":
             }
         )
         
-        submitted = st.form_submit_button("SAVE CHANGES", type="primary", use_container_width=True)
-
-    if submitted:
-        if "editor_planner" in st.session_state:
-            changes = st.session_state["editor_planner"]
-            
-            if changes["added_rows"]:
-                for row in changes["added_rows"]:
-                    current_cat = row.get("Category")
-                    if (not current_cat or str(current_cat).strip() == "") and cat_filter != "All Categories":
-                        row["Category"] = cat_filter
-
-            if changes["edited_rows"] or changes["deleted_rows"] or changes["added_rows"]:
-                database.update_planner_batch(changes, st.session_state["df_plan_snapshot"])
-                st.success("Changes saved!")
-                time.sleep(1)
-                st.rerun()
-            else:
-                st.info("No changes detected.")
\ No newline at end of file
+        st.form_submit_button("SAVE CHANGES", type="primary", use_container_width=True, disabled=READ_ONLY,
+                              on_click=save_planner_changes, args=(cat_filter,))
+
+    result = st.session_state.pop("planner_result", None)
+    if result == "saved": st.toast("Changes saved!")
+    elif result == "unchanged": st.info("No changes detected.")
+    elif result: st.error("Nothing was saved:\n\n" + "\n".join(f"- {e}" for e in result))
+
+trace = instrumentation.end_trace()
+instrumentation.metrics.write()
+if st.session_state.get('debug_panel') and trace:
+    with st.sidebar.expander("⏱ QUERY STATS"):
+        st.caption(f"{len(trace.statements)} statements · {trace.db_ms:.1f} ms in DB · {trace.elapsed_ms:.0f} ms rerun")
+        if trace.stale_reads: st.caption(f"Served from cache past the deadline: {', '.join(trace.stale_reads)}")
+        st.dataframe(pd.DataFrame(trace.function_table()), hide_index=True, width="stretch")
+        st.dataframe(pd.DataFrame(trace.top_statements()), hide_index=True, width="stretch")
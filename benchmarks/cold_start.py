@@ -0,0 +1,87 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+PAGES = ("🏃 Running Log", "📅 Planner", "🏠 Command Center")
+
+def _probe(db_url, user_id):
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    timings = {"import_ms": (time.perf_counter() - started) * 1000}
+
+    user = user_id or "user1"
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.secrets["users"] = {user: "bench"}
+    if user_id: at.secrets["shared_db_url"] = db_url
+    else: at.secrets["db_urls"] = {user: db_url}
+    step = time.perf_counter()
+    at.run()
+    timings["login_ms"] = (time.perf_counter() - step) * 1000
+    timings["altair_on_login"] = "altair" in sys.modules
+
+    at.selectbox[0].set_value(user)
+    at.text_input[0].input("bench")
+    step = time.perf_counter()
+    at.button[0].click().run()
+    timings["first_page_ms"] = (time.perf_counter() - step) * 1000
+    for page in PAGES:
+        step = time.perf_counter()
+        at.radio(key="nav_page").set_value(page).run()
+        timings[f"rerun[{page}]_ms"] = (time.perf_counter() - step) * 1000
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    timings["errors"] = [e.value for e in at.exception]
+    return timings
+
+def run(db_url, iterations=5, user_id=""):
+    from benchmarks.run import _git_commit, percentile
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        out = subprocess.run([sys.executable, "-W", "ignore", "-m", "benchmarks.cold_start", "--probe", "--db-url", db_url, "--user-id", user_id],
+                             capture_output=True, text=True, check=True, cwd=os.path.dirname(APP)).stdout
+        sample = json.loads(out.strip().splitlines()[-1])
+        sample["process_ms"] = (time.perf_counter() - started) * 1000
+        samples.append(sample)
+    names = [name for name, value in samples[0].items() if name.endswith("_ms")]
+    return {
+        "commit": _git_commit(),
+        "iterations": iterations,
+        "altair_on_login": any(s["altair_on_login"] for s in samples),
+        "errors": sorted({e for s in samples for e in s["errors"]}),
+        "results": {name: {"p50_ms": percentile([s[name] for s in samples], 50), "max_ms": max(s[name] for s in samples),
+                           "mean_ms": statistics.fmean(s[name] for s in samples)} for name in names},
+    }
+
+def print_report(report):
+    print(f"commit {report['commit']}  cold starts {report['iterations']}  altair loaded on login {report['altair_on_login']}")
+    print(f"{'step':36} {'p50':>9} {'mean':>9} {'max':>9}")
+    for name, r in report["results"].items():
+        print(f"{name:36} {r['p50_ms']:9.1f} {r['mean_ms']:9.1f} {r['max_ms']:9.1f}")
+    for error in report["errors"]: print(f"error: {error}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure app.py cold start in fresh interpreters.")
+    parser.add_argument("--db-url", required=True)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--user-id", default="", help="log in as this tenant of a shared database")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    if args.probe:
+        print(json.dumps(_probe(args.db_url, args.user_id)))
+        return
+    report = run(args.db_url, args.iterations, args.user_id)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f: json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import random
+from datetime import date, timedelta
+import bulk_io
+import database
+import schema
+import storage
+
+AMOUNTS = {
+    "Workouts": (5, 50), "Recovery": (5, 30), "Bad Habits": (1, 3),
+    "Bouldering": (1, 1), "Sport Climbing": (1, 1),
+}
+
+def _amount(rng, name, category):
+    if name == "Running (km)": return round(rng.uniform(3, 21), 2)
+    if name == "Running (pace)": return round(rng.uniform(4.2, 7.0), 2)
+    low, high = AMOUNTS.get(category, (1, 10))
+    return rng.randint(low, high)
+
+def log_rows(rng, activities, count, days):
+    today = date.today()
+    for _ in range(count):
+        name, category, _bad = rng.choice(activities)
+        yield (today - timedelta(days=rng.randrange(days)), name, _amount(rng, name, category))
+
+def run_rows(rng, count, days):
+    today = date.today()
+    for i in range(count):
+        distance = round(rng.lognormvariate(2.0, 0.45), 2)
+        pace = rng.uniform(4.2, 7.0)
+        yield (today - timedelta(days=rng.randrange(days)), distance, round(distance * pace, 1), f"synthetic run {i}")
+
+def goal_rows(rng, activities, weeks):
+    today = date.today()
+    keys = dict.fromkeys(database.get_week_key(today - timedelta(weeks=week)) for week in range(weeks))
+    for key in keys:
+        for name, category, _bad in activities:
+            if rng.random() < 0.6: yield (key, name, rng.randint(1, 40))
+
+TABLES = ["logi", "logi_archiwum", "biegi", "cele", "logi_dzien", "logi_tydzien"]
+
+def _load(backend, cur, table, columns, types, rows, user_id):
+    # COPY into a staging table and tag rows in SQL; an empty user_id would otherwise reach COPY as NULL.
+    backend.create_staging(cur, f"gen_{table}", types)
+    backend.copy_in(cur, f"gen_{table}", columns, bulk_io.RowStream(rows), header=False)
+    cur.execute(f"INSERT INTO {table} (user_id, {columns}) SELECT %s, {columns} FROM gen_{table}", (user_id,))
+
+def generate(db_url, logs=10_000, runs=1_000, years=5, seed=42, reset=True, user_id=""):
+    rng = random.Random(seed)
+    activities = list({name: (name, cat, bad) for name, cat, bad in reversed(schema.DEFAULT_ACTIVITIES)}.values())
+    days = years * 365
+    backend = storage.get_backend(db_url)
+    with backend.connection() as conn:
+        backend.migrate(conn)
+        with conn.cursor() as cur:
+            if reset:
+                for table in TABLES:
+                    cur.execute(f"DELETE FROM {table} WHERE user_id = %s", (user_id,))
+            schema.seed_tenant(cur, user_id)
+            _load(backend, cur, "logi", "data, aktywnosc, ilosc", "data DATE, aktywnosc TEXT, ilosc REAL",
+                  log_rows(rng, activities, logs, days), user_id)
+            _load(backend, cur, "biegi", "data, dystans, czas_min, notatka", "data DATE, dystans REAL, czas_min REAL, notatka TEXT",
+                  run_rows(rng, runs, days), user_id)
+            cur.execute("UPDATE biegi SET tempo_min_km = czas_min / dystans WHERE user_id = %s AND tempo_min_km IS NULL AND dystans > 0",
+                        (user_id,))
+            _load(backend, cur, "cele", "klucz_tygodnia, aktywnosc, wartosc", "klucz_tygodnia INTEGER, aktywnosc TEXT, wartosc REAL",
+                  goal_rows(rng, activities, years * 52), user_id)
+            schema.rebuild_rollups(cur, user_id)
+            cur.execute("ANALYZE")
+        conn.commit()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a database with a deterministic synthetic training history.")
+    parser.add_argument("--db-url", required=True)
+    parser.add_argument("--logs", type=int, default=10_000, help="number of logi rows (10k to 10M)")
+    parser.add_argument("--runs", type=int, default=1_000, help="number of biegi rows")
+    parser.add_argument("--years", type=int, default=5, help="history length; also the number of years of weekly goals")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--append", action="store_true", help="keep the tenant's existing rows instead of deleting them first")
+    parser.add_argument("--user-id", default="", help="tenant to generate rows for in a shared database")
+    args = parser.parse_args(argv)
+    generate(args.db_url, args.logs, args.runs, args.years, args.seed, reset=not args.append, user_id=args.user_id)
+    print(f"Generated {args.logs} logs, {args.runs} runs and {args.years} years of goals (seed {args.seed}).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+import streamlit as st
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import magic
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest, app_test
+from streamlit.testing.v1.util import build_mock_config_get_option
+import instrumentation
+from benchmarks.run import _git_commit, percentile
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+USERS = ("user1", "user2", "user3")
+PASSWORD = "load-test"
+ACTIONS = ("navigate", "quick_add", "planner_save", "run_edit")
+TRACE_KEY = "_load_test_trace"
+
+def _share_runtime():
+    # AppTest installs a mock Runtime and config patch for each run and removes them afterwards,
+    # which breaks runs still in flight on other threads. Pin one for the whole process instead.
+    class PinnedRuntime(Runtime):
+        _instance = None
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = app_test.MediaFileManager(app_test.MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = app_test.DataframeSourceManager()
+    runtime.cache_storage_manager = app_test.MemoryCacheStorageManager()
+    runtime.bidi_component_registry = app_test.BidiComponentManager()
+    runtime.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+    Runtime._instance = runtime
+    app_test.Runtime = PinnedRuntime
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+    config.get_option = build_mock_config_get_option({"global.appTest": True})
+    # Every AppTest compiles app.py itself and CPython 3.11's ast.parse is not safe across threads.
+    add_magic, lock = magic.add_magic, threading.Lock()
+
+    def locked_add_magic(code, script_path):
+        with lock: return add_magic(code, script_path)
+    magic.add_magic = locked_add_magic
+
+def _capture_traces():
+    end_trace = instrumentation.end_trace
+
+    def capture():
+        trace = end_trace()
+        st.session_state[TRACE_KEY] = trace
+        return trace
+    instrumentation.end_trace = capture
+
+def _secrets(db_url, per_profile, extra):
+    secrets = {"users": {user: PASSWORD for user in USERS}}
+    if per_profile: secrets["db_urls"] = {user: db_url for user in USERS}
+    else: secrets["shared_db_url"] = db_url
+    for item in extra:
+        key, value = item.split("=", 1)
+        secrets[key] = {"true": True, "false": False}.get(value, value)
+    return secrets
+
+def _button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+def _edit_table(at, key, changes):
+    # AppTest cannot drive st.data_editor, so send the same JSON widget state a browser edit would.
+    editor = next(node for node in at._tree if getattr(node, "key", None) == key)
+    states = at._tree.get_widget_states()
+    state = states.widgets.add()
+    state.id = editor.proto.id
+    state.string_value = json.dumps(changes)
+    return at._run(states)
+
+class Session:
+    def __init__(self, index, user, seed):
+        self.index = index
+        self.user = user
+        self.random = random.Random(seed)
+        self.at = AppTest.from_file(APP, default_timeout=60)
+        self.samples = []
+        self.errors = []
+        self.conflicts = []
+
+    def rerun(self, label, interact):
+        started = time.perf_counter()
+        try:
+            interact()
+        except Exception as e:
+            self.errors.append(f"{self.user} {label}: {type(e).__name__}: {e}")
+            return False
+        elapsed = (time.perf_counter() - started) * 1000
+        trace = self.at.session_state[TRACE_KEY] if TRACE_KEY in self.at.session_state else None
+        self.samples.append((label, elapsed, len(trace.statements) if trace else None))
+        self.errors += [f"{self.user} {label}: {e.value}" for e in self.at.exception]
+        self.errors += [f"{self.user} {label}: {e.value}" for e in self.at.error if e.value != "LIMIT"]
+        warnings = [f"{self.user} {label}: {t.value}" for t in self.at.toast if t.value.startswith("⚠️")]
+        self.conflicts += [w for w in warnings if "in another session" in w]
+        self.errors += [w for w in warnings if "in another session" not in w]
+        return not self.at.exception
+
+    def login(self):
+        def fill():
+            self.at.selectbox[0].set_value(self.user)
+            self.at.text_input[0].input(PASSWORD)
+            self.at.button[0].click().run()
+        return self.rerun("login page", self.at.run) and self.rerun("login", fill)
+
+    def page(self, name):
+        radio = self.at.sidebar.radio[0]
+        if radio.value != name: self.rerun("page switch", lambda: radio.set_value(name).run())
+
+    def navigate(self):
+        self.page("🏠 Command Center")
+        view = self.at.radio(key="cc_view")
+        self.rerun("navigate", lambda: view.set_value(self.random.choice(view.options)).run())
+
+    def quick_add(self):
+        category = self.at.sidebar.selectbox[0]
+        if "Workouts" in category.options and category.value != "Workouts":
+            self.rerun("quick add select", lambda: category.set_value("Workouts").run())
+        done = [b for b in self.at.sidebar.button if b.label == "DONE (+1)"]
+        if done: self.rerun("quick add", lambda: done[0].click().run()); return
+        self.at.sidebar.number_input[0].set_value(1)
+        self.rerun("quick add", lambda: _button(self.at, "SAVE").click().run())
+
+    def planner_save(self):
+        self.page("📅 Planner")
+        rows = len(self.at.session_state["plan_rows"][0])
+        if not rows: return
+        self.at.session_state["editor_planner"] = {"edited_rows": {self.random.randrange(rows): {"Weekly Goal": self.random.randint(0, 30)}},
+                                                   "added_rows": [], "deleted_rows": []}
+        self.rerun("planner save", lambda: _button(self.at, "SAVE CHANGES").click().run())
+
+    def run_edit(self):
+        self.page("🏃 Running Log")
+        if not len(self.at.session_state["runs_rows"][0]):
+            self.rerun("run add", lambda: _button(self.at, "SAVE RUN").click().run())
+            return
+        key = next(node.key for node in self.at._tree if str(getattr(node, "key", None)).startswith("editor_runs_"))
+        changes = {"edited_rows": {"0": {"note": f"load test {self.random.randint(0, 999)}"}}, "added_rows": [], "deleted_rows": []}
+        self.rerun("run edit", lambda: _edit_table(self.at, key, changes))
+
+    def run(self, actions, start):
+        start.wait()
+        if not self.login(): return self
+        for _ in range(actions):
+            try:
+                getattr(self, self.random.choice(ACTIONS))()
+            except Exception as e:
+                self.errors.append(f"{self.user}: {type(e).__name__}: {e}")
+        return self
+
+def _summary(samples):
+    timings = [ms for _, ms, _ in samples]
+    queries = [q for _, _, q in samples if q is not None]
+    return {
+        "reruns": len(samples),
+        "p50_ms": percentile(timings, 50), "p95_ms": percentile(timings, 95), "p99_ms": percentile(timings, 99),
+        "max_ms": max(timings), "queries_per_rerun": statistics.fmean(queries) if queries else None,
+    }
+
+def run(db_url, sessions=6, actions=20, per_profile=False, secrets=(), seed=0):
+    _share_runtime()
+    _capture_traces()
+    st.secrets = Secrets()
+    st.secrets._secrets = _secrets(db_url, per_profile, secrets)
+    start = threading.Event()
+    workers = [Session(i, USERS[i % len(USERS)], seed + i) for i in range(sessions)]
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [pool.submit(session.run, actions, start) for session in workers]
+        started = time.perf_counter()
+        start.set()
+        done = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    samples = [sample for session in done for sample in session.samples]
+    by_action = {}
+    for sample in samples: by_action.setdefault(sample[0], []).append(sample)
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "sessions": sessions,
+        "mode": "per-profile" if per_profile else "shared",
+        "elapsed_s": elapsed,
+        "reruns_per_s": len(samples) / elapsed,
+        "overall": _summary(samples),
+        "results": {action: _summary(group) for action, group in sorted(by_action.items())},
+        "errors": [error for session in done for error in session.errors],
+        "conflicts": [conflict for session in done for conflict in session.conflicts],
+    }
+
+def print_report(report):
+    print(f"commit {report['commit']}  {report['sessions']} sessions ({report['mode']})  "
+          f"{report['overall']['reruns']} reruns in {report['elapsed_s']:.1f}s ({report['reruns_per_s']:.1f}/s)")
+    print(f"{'rerun':16} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8}")
+    for name, r in [*report["results"].items(), ("overall", report["overall"])]:
+        queries = "-" if r["queries_per_rerun"] is None else f"{r['queries_per_rerun']:.1f}"
+        print(f"{name:16} {r['reruns']:7} {r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f} {queries:>8}")
+    print(f"errors: {len(report['errors'])}  edit conflicts reported: {len(report['conflicts'])}")
+    for error in report["errors"][:20]: print(f"  {error}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive app.py from concurrent AppTest sessions and report rerun latency.")
+    parser.add_argument("--db-url", required=True, help="shared database, or every profile's database with --per-profile")
+    parser.add_argument("--sessions", type=int, default=6, help="concurrent sessions, assigned to user1..user3 in turn")
+    parser.add_argument("--actions", type=int, default=20, help="interactions per session after login")
+    parser.add_argument("--per-profile", action="store_true", help="use db_urls instead of shared_db_url")
+    parser.add_argument("--secret", action="append", default=[], help="extra secrets.toml entry, e.g. write_behind=true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    report = run(args.db_url, args.sessions, args.actions, args.per_profile, args.secret, args.seed)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f: json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
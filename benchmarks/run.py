@@ -0,0 +1,118 @@
+import argparse
+import json
+import logging
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+import streamlit as st
+import database
+import instrumentation
+import query_cache
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def scenarios():
+    activities = database.get_config()['name'].tolist()
+    planner = database.get_full_planner()
+    goal_edit = {"deleted_rows": [], "added_rows": [],
+                 "edited_rows": {idx: {"Weekly Goal": (idx * 7) % 30} for idx in range(len(planner))}}
+    return {
+        "get_config": lambda: database.get_config(),
+        "get_activity_structure": lambda: database.get_activity_structure(),
+        "get_dashboard_snapshot": lambda: database.get_dashboard_snapshot(),
+        "get_weekly_state_dict": lambda: database.get_weekly_state_dict(),
+        "get_current_goals_dict": lambda: database.get_current_goals_dict(),
+        "get_chart_data[This Year]": lambda: database.get_chart_data(activities, "This Year"),
+        "get_trend_series[Last 365 Days]": lambda: database.get_trend_series(activities, "Last 365 Days"),
+        "calc_historical_goal[This Year]": lambda: database.calc_historical_goal(activities[0], "This Year"),
+        "calc_historical_goals[This Year]": lambda: database.calc_historical_goals(activities, "This Year"),
+        "get_full_planner": lambda: database.get_full_planner(),
+        "get_run_page": lambda: database.get_run_page(),
+        "update_planner_batch": lambda: database.update_planner_batch(goal_edit, database.planner_rows(database.get_full_planner())),
+    }
+
+def measure(func, iterations, warm):
+    timings, statements = [], []
+    for _ in range(iterations):
+        if not warm: query_cache.cache.clear()
+        instrumentation.start_trace()
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+        statements.append(len(instrumentation.end_trace().statements))
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(timings, 50), "p95_ms": percentile(timings, 95), "p99_ms": percentile(timings, 99),
+        "mean_ms": statistics.fmean(timings), "max_ms": max(timings),
+        "queries_per_call": statistics.fmean(statements),
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _table_sizes():
+    with database.connect_db() as conn, conn.cursor() as cur:
+        sizes = {}
+        for table in ("logi", "biegi", "cele"):
+            cur.execute(f"SELECT count(*) FROM {table} WHERE user_id = %s", (database.current_user_id(),))
+            sizes[table] = cur.fetchone()[0]
+    return sizes
+
+def run(db_url, iterations=50, warm=False, only=None, user_id="", local_snapshot=False):
+    st.session_state['db_url'] = db_url
+    st.session_state['user_id'] = user_id
+    st.session_state['write_behind'] = False
+    st.session_state['local_snapshot'] = local_snapshot
+    database.init_db()
+    results = {}
+    for name, func in scenarios().items():
+        if only and not any(o in name for o in only): continue
+        func()
+        results[name] = measure(func, iterations, warm)
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "cache": "warm" if warm else "cold",
+        "rows": _table_sizes(),
+        "results": results,
+    }
+
+def print_report(report, baseline=None):
+    print(f"commit {report['commit']}  rows {report['rows']}  cache {report['cache']}")
+    print(f"{'function':36} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8}")
+    for name, r in report["results"].items():
+        line = f"{name:36} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f} {r['queries_per_call']:8.1f}"
+        if baseline and name in baseline["results"]:
+            line += f"  p50 x{r['p50_ms'] / max(baseline['results'][name]['p50_ms'], 1e-9):.2f} vs {baseline['commit']}"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark database.py read and write paths.")
+    parser.add_argument("--db-url", required=True)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warm", action="store_true", help="keep the query cache between iterations")
+    parser.add_argument("--only", nargs="*", help="substring filter on scenario names")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to compare p50 against")
+    parser.add_argument("--user-id", default="", help="tenant to benchmark in a shared database")
+    parser.add_argument("--local-snapshot", action="store_true", help="serve reads from the local Arrow snapshot")
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    report = run(args.db_url, args.iterations, args.warm, args.only, args.user_id, args.local_snapshot)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f: baseline = json.load(f)
+    print_report(report, baseline)
+    if args.out:
+        with open(args.out, "w") as f: json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
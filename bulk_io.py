@@ -0,0 +1,214 @@
+import csv
+import io
+import math
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from datetime import datetime
+import database
+import query_cache
+import schema
+import storage
+
+LOG_COPY_COLUMNS = "data, aktywnosc, ilosc"
+RUN_COPY_COLUMNS = "data, dystans, czas_min, notatka"
+
+class RowStream(io.TextIOBase):
+    def __init__(self, rows):
+        self._lines = self._render(rows)
+        self._buffer = ""
+
+    def _render(self, rows):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for row in rows:
+            writer.writerow(row)
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None: break
+            self._buffer += line
+        if size < 0: size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    def readline(self, size=-1):
+        if "\n" not in self._buffer: self._buffer += next(self._lines, "")
+        end = self._buffer.find("\n") + 1 or len(self._buffer)
+        line, self._buffer = self._buffer[:end], self._buffer[end:]
+        return line
+
+def _stage_logs(backend, cur):
+    backend.create_staging(cur, "import_logi", "data DATE, aktywnosc TEXT, ilosc REAL")
+
+def _load_staged_logs(cur, user_id):
+    cur.execute(f"INSERT INTO logi (user_id, {LOG_COPY_COLUMNS}) SELECT %s, {LOG_COPY_COLUMNS} FROM import_logi", (user_id,))
+    inserted = cur.rowcount
+    schema.merge_rollups(cur, "import_logi", user_id)
+    return inserted
+
+def import_logs_csv(stream):
+    backend = database.get_backend()
+    with database.connect_db() as conn, conn.cursor() as cur:
+        _stage_logs(backend, cur)
+        backend.copy_in(cur, "import_logi", LOG_COPY_COLUMNS, stream)
+        inserted = _load_staged_logs(cur, database.current_user_id())
+        conn.commit()
+    database.invalidate("state", "chart")
+    return inserted
+
+def _copy_runs(stream, header, with_logs):
+    backend = database.get_backend()
+    user_id = database.current_user_id()
+    with database.connect_db() as conn, conn.cursor() as cur:
+        backend.create_staging(cur, "import_biegi", "data DATE, dystans REAL, czas_min REAL, notatka TEXT")
+        backend.copy_in(cur, "import_biegi", RUN_COPY_COLUMNS, stream, header)
+        cur.execute("""
+            INSERT INTO biegi (user_id, data, dystans, czas_min, tempo_min_km, notatka)
+            SELECT %s, data, dystans, czas_min, CASE WHEN dystans > 0 THEN czas_min / dystans ELSE 0 END, COALESCE(notatka, '')
+            FROM import_biegi
+        """, (user_id,))
+        inserted = cur.rowcount
+        if with_logs:
+            _stage_logs(backend, cur)
+            cur.execute("""
+                INSERT INTO import_logi (data, aktywnosc, ilosc)
+                SELECT data, 'Running (km)', dystans FROM import_biegi
+                UNION ALL
+                SELECT data, 'Running (pace)', CASE WHEN dystans > 0 THEN czas_min / dystans ELSE 0 END FROM import_biegi
+            """)
+            _load_staged_logs(cur, user_id)
+        conn.commit()
+    database.invalidate("state", "chart", "runs")
+    return inserted
+
+def import_runs_csv(stream, with_logs=True):
+    return _copy_runs(stream, True, with_logs)
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _parse_time(text):
+    return datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+
+def _haversine_km(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(h))
+
+def summarize_gpx(path):
+    distance, first, last, prev = 0.0, None, None, None
+    point = None
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        tag = _local(elem.tag)
+        if event == "start":
+            if tag == "trkpt": point = (float(elem.get("lat")), float(elem.get("lon")))
+            continue
+        if tag == "time" and point is not None and elem.text:
+            stamp = _parse_time(elem.text)
+            first = first or stamp
+            last = stamp
+        elif tag == "trkpt":
+            if prev is not None: distance += _haversine_km(prev, point)
+            prev, point = point, None
+            elem.clear()
+    if first is None: return None
+    return (first.date(), round(distance, 3), round((last - first).total_seconds() / 60, 2), os.path.basename(path))
+
+def summarize_tcx(path):
+    distance, seconds, started = 0.0, 0.0, None
+    for _, elem in ET.iterparse(path):
+        tag = _local(elem.tag)
+        if tag == "Lap":
+            started = started or _parse_time(elem.get("StartTime"))
+            for child in elem:
+                if _local(child.tag) == "TotalTimeSeconds": seconds += float(child.text)
+                elif _local(child.tag) == "DistanceMeters": distance += float(child.text) / 1000
+            elem.clear()
+    if started is None: return None
+    return (started.date(), round(distance, 3), round(seconds / 60, 2), os.path.basename(path))
+
+def import_activity_files(paths, with_logs=True):
+    parsers = {".gpx": summarize_gpx, ".tcx": summarize_tcx}
+    summaries = (parsers[os.path.splitext(p)[1].lower()](p) for p in paths)
+    return _copy_runs(RowStream(s for s in summaries if s), False, with_logs)
+
+def export_logs(out):
+    query = "SELECT data AS date, aktywnosc AS activity, ilosc AS amount FROM logi WHERE user_id = %s ORDER BY id"
+    with database.connect_db() as conn, conn.cursor() as cur:
+        database.get_backend().copy_out(cur, query, out, (database.current_user_id(),))
+
+def export_runs(out):
+    query = "SELECT data AS date, dystans AS distance, czas_min AS time_min, notatka AS note FROM biegi WHERE user_id = %s ORDER BY data, id"
+    with database.connect_db() as conn, conn.cursor() as cur:
+        database.get_backend().copy_out(cur, query, out, (database.current_user_id(),))
+
+MERGE_TABLES = [
+    ("config_aktywnosci", "nazwa, kategoria, czy_zly", "nazwa TEXT, kategoria TEXT, czy_zly INTEGER", "nazwa"),
+    ("cele", "klucz_tygodnia, aktywnosc, wartosc", "klucz_tygodnia INTEGER, aktywnosc TEXT, wartosc REAL", "klucz_tygodnia, aktywnosc"),
+    ("biegi", "data, dystans, czas_min, tempo_min_km, notatka", "data DATE, dystans REAL, czas_min REAL, tempo_min_km REAL, notatka TEXT", "id"),
+]
+MERGE_LOG_COLUMNS = f"id, {LOG_COPY_COLUMNS}, scalony_do, scalono_at"
+
+def _stage_source(source, query, params, target, cur, table, columns, types):
+    with tempfile.TemporaryFile("w+", newline="") as spool:
+        with source.connection() as source_conn, source_conn.cursor() as source_cur:
+            source.copy_out(source_cur, query, spool, params)
+        spool.seek(0)
+        target.create_staging(cur, table, types)
+        target.copy_in(cur, table, columns, spool)
+
+def _merge_logs(source, source_user_id, target, cur, user_id):
+    # Archived rows are inserted into logi alongside live ones, in source id order, so both draw new ids from the
+    # target sequence in their original order: undo compares archive and logi ids, and scalony_do must follow its row.
+    _stage_source(source, f"""SELECT id, {LOG_COPY_COLUMNS}, NULL AS scalony_do, NULL AS scalono_at FROM logi WHERE user_id = %s
+                              UNION ALL
+                              SELECT {MERGE_LOG_COLUMNS} FROM logi_archiwum WHERE user_id = %s ORDER BY id""",
+                  (source_user_id, source_user_id), target, cur, "merge_logi", MERGE_LOG_COLUMNS,
+                  "id INTEGER, data DATE, aktywnosc TEXT, ilosc REAL, scalony_do INTEGER, scalono_at TIMESTAMPTZ")
+    cur.execute("DELETE FROM logi_archiwum WHERE user_id = %s", (user_id,))
+    cur.execute("DELETE FROM logi WHERE user_id = %s", (user_id,))
+    cur.execute(f"INSERT INTO logi (user_id, {LOG_COPY_COLUMNS}) SELECT %s, {LOG_COPY_COLUMNS} FROM merge_logi ORDER BY id", (user_id,))
+    target.create_staging(cur, "merge_logi_ids", "stare INTEGER PRIMARY KEY, nowe INTEGER")
+    cur.execute("""
+        INSERT INTO merge_logi_ids (stare, nowe)
+        SELECT s.id, n.id FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS poz FROM merge_logi) s
+        JOIN (SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS poz FROM logi WHERE user_id = %s) n ON n.poz = s.poz
+    """, (user_id,))
+    cur.execute("""
+        INSERT INTO logi_archiwum (user_id, id, data, aktywnosc, ilosc, scalony_do, scalono_at)
+        SELECT %s, i.nowe, m.data, m.aktywnosc, m.ilosc, d.nowe, m.scalono_at
+        FROM merge_logi m JOIN merge_logi_ids i ON i.stare = m.id JOIN merge_logi_ids d ON d.stare = m.scalony_do
+    """, (user_id,))
+    archived = cur.rowcount
+    cur.execute("DELETE FROM logi WHERE user_id = %s AND id IN (SELECT id FROM logi_archiwum WHERE user_id = %s)", (user_id, user_id))
+    cur.execute("SELECT count(*) FROM logi WHERE user_id = %s", (user_id,))
+    return cur.fetchone()[0], archived
+
+def merge_tenant(source_url, target_url, user_id, source_user_id=""):
+    source, target = storage.get_backend(source_url), storage.get_backend(target_url)
+    with source.connection() as conn:
+        source.migrate(conn)
+    counts = {}
+    with target.connection() as conn:
+        target.migrate(conn)
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO uzytkownicy (user_id) VALUES (%s) ON CONFLICT DO NOTHING", (user_id,))
+            for table, columns, types, order in MERGE_TABLES:
+                _stage_source(source, f"SELECT {columns} FROM {table} WHERE user_id = %s ORDER BY {order}", (source_user_id,),
+                              target, cur, f"merge_{table}", columns, types)
+                cur.execute(f"DELETE FROM {table} WHERE user_id = %s", (user_id,))
+                cur.execute(f"INSERT INTO {table} (user_id, {columns}) SELECT %s, {columns} FROM merge_{table}", (user_id,))
+                counts[table] = cur.rowcount
+            counts["logi"], counts["logi_archiwum"] = _merge_logs(source, source_user_id, target, cur, user_id)
+            schema.rebuild_rollups(cur, user_id)
+        conn.commit()
+    query_cache.invalidate(database.tenant_scope(target_url, user_id), "config", "goals", "state", "chart", "runs")
+    return counts
@@ -0,0 +1,67 @@
+import select
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+from schema import CHANGE_CHANNEL
+
+PING_INTERVAL = 30.0
+MAX_BACKOFF = 60.0
+
+class ChangeListener:
+    def __init__(self, db_url, on_change, on_reconnect):
+        self.db_url = db_url
+        self.connected = False
+        self.last_error = None
+        self._on_change = on_change
+        self._on_reconnect = on_reconnect
+        self._worker = threading.Thread(target=self._run, name="change-listener", daemon=True)
+        self._worker.start()
+
+    def _listen(self):
+        conn = psycopg2.connect(self.db_url)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANGE_CHANNEL}")
+        return conn
+
+    def _drain(self, conn):
+        conn.poll()
+        changes = set()
+        while conn.notifies:
+            table, op, user_id = conn.notifies.pop(0).payload.split(":", 2)
+            changes.add((table, op, user_id))
+        for table, op, user_id in changes: self._on_change(table, op, user_id)
+
+    def _run(self):
+        delay, listened = 1.0, False
+        while True:
+            conn = None
+            try:
+                conn = self._listen()
+                # Anything written while we were not listening is unknown, so drop what was cached in between.
+                if listened: self._on_reconnect()
+                listened, self.connected, self.last_error, delay = True, True, None, 1.0
+                while True:
+                    if select.select([conn], [], [], PING_INTERVAL) == ([], [], []):
+                        with conn.cursor() as cur: cur.execute("SELECT 1")
+                    self._drain(conn)
+            except Exception as e:
+                self.connected, self.last_error = False, str(e)
+                if conn is not None: conn.close()
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_BACKOFF)
+
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+def peek_listener(db_url):
+    with _listeners_lock:
+        return _listeners.get(db_url)
+
+def get_listener(db_url, on_change, on_reconnect):
+    with _listeners_lock:
+        listener = _listeners.get(db_url)
+        if listener is None:
+            listener = _listeners[db_url] = ChangeListener(db_url, on_change, on_reconnect)
+    return listener
@@ -1,260 +1,867 @@
 import pandas as pd
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import date, timedelta
-import psycopg2
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import change_listener
+import instrumentation
+import local_snapshot
+import query_cache
+import schema
+import storage
+import write_queue
 
-@st.cache_resource(ttl=3600, validate=lambda conn: conn.closed == 0)
-def get_connection_cached(db_url):
-    return psycopg2.connect(db_url)
+def get_backend():
+    return storage.get_backend(st.session_state['db_url'])
 
+@contextmanager
 def connect_db():
     if 'db_url' not in st.session_state or not st.session_state['db_url']:
-        return None
-    try:
-        return get_connection_cached(st.session_state['db_url'])
-    except Exception:
-        st.cache_resource.clear()
-        return get_connection_cached(st.session_state['db_url'])
+        yield None
+        return
+    with get_backend().connection() as conn:
+        yield conn
+
+def current_user_id():
+    return st.session_state.get('user_id') or ""
+
+def tenant_scope(db_url, user_id):
+    return f"{db_url}#{user_id}" if user_id else db_url
+
+def cache_scope():
+    db_url = st.session_state.get('db_url')
+    return tenant_scope(db_url, current_user_id()) if db_url else None
+
+LISTEN_TTL = 6 * 3600
+
+def _cache_ttl():
+    listener = change_listener.peek_listener(st.session_state.get('db_url'))
+    return LISTEN_TTL if listener and listener.connected else query_cache.DEFAULT_TTL
+
+def cached(*tags):
+    return query_cache.cached(cache_scope, *tags, ttl=_cache_ttl)
+
+def invalidate(*tags):
+    local_snapshot.mark_stale(cache_scope())
+    query_cache.invalidate(cache_scope(), *tags)
+
+def get_local_snapshot():
+    scope = cache_scope()
+    if not scope or not st.session_state.get('local_snapshot'): return None
+    db_url, user_id = st.session_state['db_url'], current_user_id()
+    return local_snapshot.get_snapshot(scope, lambda: storage.get_backend(db_url).connection(), user_id)
+
+def sync_local_snapshot():
+    snapshot = get_local_snapshot()
+    if not snapshot: return
+    changed = snapshot.refresh(local_snapshot.SYNC_INTERVAL)
+    tags = {tag for name in changed for tag in local_snapshot.TABLE_TAGS[name]}
+    if tags: query_cache.invalidate(cache_scope(), *tags)
+
+def get_snapshot_status():
+    snapshot = get_local_snapshot()
+    if not snapshot: return {"synced_at": None, "last_error": None}
+    return {"synced_at": snapshot.synced_at, "last_error": snapshot.last_error}
+
+_change_versions = {}
+
+def _notify_scope(scope, tags, op=None):
+    _change_versions[scope] = _change_versions.get(scope, 0) + 1
+    # Inserted runs are picked up incrementally; only edits and deletes force a full analytics rebuild.
+    if "runs" in tags and op != "insert": _run_generations[scope] = _run_generations.get(scope, 0) + 1
+    local_snapshot.mark_stale(scope)
+    query_cache.invalidate(scope, *tags)
+
+def start_change_listener():
+    db_url = st.session_state['db_url']
+    if get_backend().name != "postgres": return
+
+    def on_change(table, op, user_id):
+        tags = local_snapshot.TABLE_TAGS.get(table)
+        if tags: _notify_scope(tenant_scope(db_url, user_id), tags, op)
+
+    def on_reconnect():
+        tags = {tag for tags in local_snapshot.TABLE_TAGS.values() for tag in tags}
+        for scope in query_cache.cache.scopes() | set(_change_versions):
+            if scope == db_url or scope.startswith(f"{db_url}#"): _notify_scope(scope, tags)
+    change_listener.get_listener(db_url, on_change, on_reconnect)
+
+def change_version():
+    return _change_versions.get(cache_scope(), 0)
+
+PREFETCH_WORKERS = 4
+QUERY_TIMEOUT = 1.5
+_prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+def prefetch(calls, timeout=None):
+    ctx, trace = get_script_run_ctx(), instrumentation.current_trace()
+    deadline = time.monotonic() + (timeout or st.session_state.get('query_timeout') or QUERY_TIMEOUT)
+
+    def submit(load):
+        def run():
+            add_script_run_ctx(threading.current_thread(), ctx)
+            instrumentation.use_trace(trace)
+            try: load()
+            finally: instrumentation.use_trace(None)
+        _prefetch_pool.submit(run)
+
+    futures = []
+    for func, *args in calls:
+        future = func.prefetch(submit, deadline, *args)
+        if future is not None: futures.append(future)
+    return futures
+
+_migrated = set()
+_migrate_lock = threading.Lock()
 
 def init_db():
-    conn = connect_db()
-    if not conn: return
-    
-    with conn.cursor() as cur:
-        cur.execute('''CREATE TABLE IF NOT EXISTS logi 
-                        (id SERIAL PRIMARY KEY, data TEXT, aktywnosc TEXT, ilosc REAL)''')
-        
-        cur.execute('''CREATE TABLE IF NOT EXISTS cele 
-                        (klucz_tygodnia TEXT, aktywnosc TEXT, wartosc REAL, 
-                        PRIMARY KEY (klucz_tygodnia, aktywnosc))''')
-        
-        cur.execute('''CREATE TABLE IF NOT EXISTS config_aktywnosci 
-                        (nazwa TEXT PRIMARY KEY, kategoria TEXT, czy_zly INTEGER)''')
-        
-        cur.execute('''CREATE TABLE IF NOT EXISTS biegi 
-                        (id SERIAL PRIMARY KEY, data TEXT, dystans REAL, czas_min REAL, tempo_min_km REAL, notatka TEXT)''')
-        
+    scope = cache_scope()
+    if not scope or scope in _migrated: return
+    # Rows journalled before a restart are only flushed, counted and undoable once their queue is open again.
+    if os.path.exists(write_queue.journal_path(scope)): get_write_queue()
+    snapshot = get_local_snapshot()
+    if snapshot and snapshot.last_error: return
+    with _migrate_lock:
+        if scope in _migrated: return
+        try:
+            with connect_db() as conn:
+                get_backend().migrate(conn)
+                with conn.cursor() as cur:
+                    schema.seed_tenant(cur, current_user_id())
+                conn.commit()
+        except get_backend().Error as e:
+            if snapshot and snapshot.mark_offline(e): return
+            raise
+        _migrated.add(scope)
+
+def to_day(value):
+    if value is None: return date.today()
+    if isinstance(value, date): return value
+    return pd.Timestamp(value).date()
+
+def _update_rollups(cur, user_id, entries):
+    days, weeks = {}, {}
+    for day, activity, amount in entries:
+        d = to_day(day)
+        days[(str(d), activity)] = days.get((str(d), activity), 0) + amount
+        weeks[(get_week_key(d), activity)] = weeks.get((get_week_key(d), activity), 0) + amount
+    if not days: return
+    backend = storage.for_cursor(cur)
+    backend.execute_values(cur, """
+        INSERT INTO logi_dzien (user_id, data, aktywnosc, suma) VALUES %s
+        ON CONFLICT (user_id, data, aktywnosc) DO UPDATE SET suma = logi_dzien.suma + EXCLUDED.suma
+    """, [(user_id, k[0], k[1], v) for k, v in days.items()], template="(%s, %s::date, %s, %s)")
+    backend.execute_values(cur, """
+        INSERT INTO logi_tydzien (user_id, klucz_tygodnia, aktywnosc, suma) VALUES %s
+        ON CONFLICT (user_id, klucz_tygodnia, aktywnosc) DO UPDATE SET suma = logi_tydzien.suma + EXCLUDED.suma
+    """, [(user_id, k[0], k[1], v) for k, v in weeks.items()])
+
+def _insert_logs(cur, user_id, entries):
+    if not entries: return
+    storage.for_cursor(cur).execute_values(cur, "INSERT INTO logi (user_id, data, aktywnosc, ilosc) VALUES %s",
+                                           [(user_id, *entry) for entry in entries], template="(%s, %s::date, %s, %s)")
+    _update_rollups(cur, user_id, entries)
+
+def _running_logs(run_date, distance, pace):
+    return [(run_date, "Running (km)", distance), (run_date, "Running (pace)", pace)]
+
+def rebuild_rollups():
+    with connect_db() as conn, conn.cursor() as cur:
+        groups = schema.rebuild_rollups(cur, current_user_id())
         conn.commit()
-        
-        cur.execute("SELECT count(*) FROM config_aktywnosci")
-        if cur.fetchone()[0] == 0:
-            data = [
-                ("Pushups", "Workouts", 0), ("Pullups", "Workouts", 0), 
-                ("Pool (laps)", "Workouts", 0), ("Running (km)", "Workouts", 0), ("Running (pace)", "Workouts", 0),
-                ("Coffee", "Bad Habits", 1), ("Sweets", "Bad Habits", 1), ("Junk Food", "Bad Habits", 1), ("Alcohol", "Bad Habits", 1),
-                ("Sauna (min)", "Recovery", 0), ("Supplements", "Recovery", 0),
-                ("5", "Bouldering", 0), ("6A", "Bouldering", 0), ("6A+", "Bouldering", 0), ("6B", "Bouldering", 0), ("6C", "Bouldering", 0),
-                ("5", "Sport Climbing", 0), ("6a", "Sport Climbing", 0), ("6a+", "Sport Climbing", 0), ("6b", "Sport Climbing", 0)
-            ]
-            query = "INSERT INTO config_aktywnosci (nazwa, kategoria, czy_zly) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING"
-            cur.executemany(query, data)
-            conn.commit()
+    invalidate("state", "chart")
+    return groups
+
+def _flush_queued_logs(db_url, user_id, journal_id, rows):
+    with storage.get_backend(db_url).connection() as conn, conn.cursor() as cur:
+        lock = _begin_locked(cur)
+        cur.execute("INSERT INTO kolejka_zapisow (dziennik) VALUES (%s) ON CONFLICT (dziennik) DO NOTHING", (journal_id,))
+        cur.execute(f"SELECT ostatni_id FROM kolejka_zapisow WHERE dziennik = %s{lock}", (journal_id,))
+        applied = cur.fetchone()[0]
+        _insert_logs(cur, user_id, [row[1:] for row in rows if row[0] > applied])
+        cur.execute("UPDATE kolejka_zapisow SET ostatni_id = %s WHERE dziennik = %s", (max(applied, rows[-1][0]), journal_id))
+        conn.commit()
+
+def _queued_logs_flushed(db_url, user_id):
+    local_snapshot.mark_stale(tenant_scope(db_url, user_id))
+    query_cache.invalidate(tenant_scope(db_url, user_id), "state", "chart")
+
+def get_write_queue():
+    db_url, user_id = st.session_state['db_url'], current_user_id()
+    return write_queue.get_queue(cache_scope(), lambda journal_id, rows: _flush_queued_logs(db_url, user_id, journal_id, rows),
+                                 lambda: _queued_logs_flushed(db_url, user_id))
+
+def _pending_logs():
+    queue = write_queue.peek_queue(cache_scope())
+    return queue.pending() if queue else []
+
+def get_write_status():
+    queue = write_queue.peek_queue(cache_scope())
+    if not queue: return {"pending": 0, "last_flush": None, "last_error": None}
+    return {"pending": queue.pending_count(), "last_flush": queue.last_flush, "last_error": queue.last_error}
 
 def undo_last_log():
-    conn = connect_db()
+    queue = write_queue.peek_queue(cache_scope())
+    last = queue.pop_last() if queue else None
+    if last: return f"{last[1]} ({last[2]})"
+
     msg = None
-    with conn.cursor() as cur:
-        cur.execute("SELECT id, aktywnosc, ilosc FROM logi ORDER BY id DESC LIMIT 1")
+    user_id = current_user_id()
+    with connect_db() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT * FROM (SELECT id, aktywnosc, ilosc, data, scalony_do FROM logi_archiwum WHERE user_id = %s ORDER BY id DESC LIMIT 1) a
+            UNION ALL
+            SELECT * FROM (SELECT id, aktywnosc, ilosc, data, CAST(NULL AS INTEGER) FROM logi l WHERE user_id = %s
+                           AND NOT EXISTS (SELECT 1 FROM logi_archiwum a WHERE a.user_id = l.user_id AND a.scalony_do = l.id)
+                           ORDER BY id DESC LIMIT 1) l
+            ORDER BY 1 DESC LIMIT 1
+        """, (user_id, user_id))
         last = cur.fetchone()
         
-        if last:
-            cur.execute("DELETE FROM logi WHERE id = %s", (last[0],))
+        removed = False
+        if last and last[4] is None:
+            cur.execute("DELETE FROM logi WHERE user_id = %s AND id = %s", (user_id, last[0]))
+            removed = cur.rowcount == 1
+        elif last:
+            cur.execute("DELETE FROM logi_archiwum WHERE user_id = %s AND id = %s", (user_id, last[0]))
+            removed = cur.rowcount == 1
+            if removed:
+                cur.execute("UPDATE logi SET ilosc = ilosc - %s WHERE user_id = %s AND id = %s", (last[2], user_id, last[4]))
+                cur.execute("""DELETE FROM logi WHERE user_id = %s AND id = %s
+                               AND NOT EXISTS (SELECT 1 FROM logi_archiwum WHERE user_id = %s AND scalony_do = %s)""",
+                            (user_id, last[4], user_id, last[4]))
+        if removed:
+            _update_rollups(cur, user_id, [(last[3], last[1], -last[2])])
             conn.commit()
             msg = f"{last[1]} ({last[2]})"
+    if removed and last[4] is not None: local_snapshot.mark_stale(cache_scope(), {"logi"})
+    invalidate("state", "chart")
     return msg
 
+def _begin_locked(cur, of=None):
+    if storage.for_cursor(cur) is storage.SqliteBackend:
+        cur.execute("BEGIN IMMEDIATE")
+        return ""
+    return f" FOR UPDATE OF {of}" if of else " FOR UPDATE"
+
+COMPACT_INTERVAL = 6 * 3600
+
+def _compact_day(cur, user_id, day):
+    lock = _begin_locked(cur)
+    cur.execute(f"""
+        SELECT id, aktywnosc, ilosc, EXISTS (SELECT 1 FROM logi_archiwum a WHERE a.user_id = l.user_id AND a.scalony_do = l.id)
+        FROM logi l WHERE user_id = %s AND data = %s ORDER BY aktywnosc, id{lock}
+    """, (user_id, day))
+    groups = {}
+    for row in cur.fetchall(): groups.setdefault(row[1], []).append(row)
+
+    merged = 0
+    for activity, rows in groups.items():
+        if len(rows) < 2: continue
+        ids = [row[0] for row in rows]
+        cur.execute("INSERT INTO logi (user_id, data, aktywnosc, ilosc) VALUES (%s, %s, %s, %s) RETURNING id",
+                    (user_id, day, activity, sum(row[2] for row in rows)))
+        target = cur.fetchone()[0]
+        clicks = [(user_id, row[0], day, activity, row[2], target) for row in rows if not row[3]]
+        folded = [row[0] for row in rows if row[3]]
+        if clicks:
+            storage.for_cursor(cur).execute_values(cur, "INSERT INTO logi_archiwum (user_id, id, data, aktywnosc, ilosc, scalony_do) VALUES %s",
+                                                   clicks, template="(%s, %s, %s::date, %s, %s, %s)")
+        if folded:
+            cur.execute(f"UPDATE logi_archiwum SET scalony_do = %s WHERE user_id = %s AND scalony_do IN ({_placeholders(folded)})",
+                        [target, user_id, *folded])
+        cur.execute(f"DELETE FROM logi WHERE user_id = %s AND id IN ({_placeholders(ids)})", [user_id, *ids])
+        merged += len(ids) - 1
+    return merged
+
+def compact_logs(db_url, user_id="", before=None):
+    before = str(to_day(before))
+    merged = 0
+    with storage.get_backend(db_url).connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT data FROM logi WHERE user_id = %s AND data < %s GROUP BY data, aktywnosc HAVING count(*) > 1",
+                        (user_id, before))
+            days = sorted({str(row[0]) for row in cur.fetchall()})
+        conn.commit()
+        for day in days:
+            with conn.cursor() as cur:
+                merged += _compact_day(cur, user_id, day)
+            conn.commit()
+    if merged: local_snapshot.mark_stale(tenant_scope(db_url, user_id))
+    return merged
+
+_compactors = set()
+_compactors_lock = threading.Lock()
+
+def start_log_compaction(interval=COMPACT_INTERVAL):
+    scope, db_url, user_id = cache_scope(), st.session_state['db_url'], current_user_id()
+    with _compactors_lock:
+        if scope in _compactors: return
+        _compactors.add(scope)
+
+    def run():
+        while True:
+            try: compact_logs(db_url, user_id)
+            except Exception: pass
+            time.sleep(interval)
+    threading.Thread(target=run, name="log-compaction", daemon=True).start()
+
 def add_run(distance, time_min, note="", run_date=None):
-    if run_date is None: run_date = str(date.today())
-    else: run_date = str(run_date)
+    run_date = str(to_day(run_date))
     pace = time_min / distance if distance > 0 else 0
     
-    conn = connect_db()
-    with conn.cursor() as cur:
-        cur.execute("INSERT INTO biegi (data, dystans, czas_min, tempo_min_km, notatka) VALUES (%s, %s, %s, %s, %s)", 
-                      (run_date, distance, time_min, pace, note))
-        cur.execute("INSERT INTO logi (data, aktywnosc, ilosc) VALUES (%s, %s, %s)", (run_date, "Running (km)", distance))
-        cur.execute("INSERT INTO logi (data, aktywnosc, ilosc) VALUES (%s, %s, %s)", (run_date, "Running (pace)", pace))
+    user_id = current_user_id()
+    with connect_db() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO biegi (user_id, data, dystans, czas_min, tempo_min_km, notatka) VALUES (%s, %s, %s, %s, %s, %s)", 
+                      (user_id, run_date, distance, time_min, pace, note))
+        _insert_logs(cur, user_id, _running_logs(run_date, distance, pace))
         conn.commit()
+    invalidate("state", "chart", "runs")
+
+_run_generations = {}
+
+def run_generation():
+    return _run_generations.get(cache_scope(), 0)
+
+def _bump_run_generation():
+    scope = cache_scope()
+    _run_generations[scope] = _run_generations.get(scope, 0) + 1
+    local_snapshot.mark_stale(scope)
 
 def update_run(run_id, column, new_value):
-    conn = connect_db()
     col_map = {"distance": "dystans", "time_min": "czas_min", "note": "notatka", "date": "data"}
     db_col = col_map.get(column, column)
     
     allowed = ["dystans", "czas_min", "notatka", "data"]
     if db_col not in allowed: return
 
-    with conn.cursor() as cur:
-        query = f"UPDATE biegi SET {db_col} = %s WHERE id = %s"
-        cur.execute(query, (new_value, run_id))
+    user_id = current_user_id()
+    with connect_db() as conn, conn.cursor() as cur:
+        query = f"UPDATE biegi SET {db_col} = %s, wersja = wersja + 1 WHERE user_id = %s AND id = %s"
+        cur.execute(query, (new_value, user_id, run_id))
         if db_col in ['dystans', 'czas_min']:
-            cur.execute("UPDATE biegi SET tempo_min_km = czas_min / dystans WHERE id = %s", (run_id,))
+            cur.execute("UPDATE biegi SET tempo_min_km = czas_min / dystans WHERE user_id = %s AND id = %s", (user_id, run_id))
         conn.commit()
+    _bump_run_generation()
+    invalidate("runs")
 
 def delete_run(run_id):
-    conn = connect_db()
-    with conn.cursor() as cur:
-        cur.execute("DELETE FROM biegi WHERE id = %s", (run_id,))
+    with connect_db() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM biegi WHERE user_id = %s AND id = %s", (current_user_id(), run_id))
         conn.commit()
+    _bump_run_generation()
+    invalidate("runs")
 
-def get_run_history():
-    conn = connect_db()
-    query = """
-    SELECT id, data as date, dystans as distance, czas_min as time_min, tempo_min_km as pace, notatka as note 
-    FROM biegi ORDER BY data DESC, id DESC
+RUN_COLUMNS = ["date", "distance", "time_min", "note"]
+
+def _placeholders(values):
+    return ','.join('%s' for _ in values)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+
+def run_rows(df_runs):
+    return df_runs["id"].to_numpy(), df_runs.pop("version").to_numpy()
+
+def apply_run_changes(changes, rows):
+    ids, versions = rows
+    errors = [f"Row {idx + 1}: no longer on this page." for idx in changes["edited_rows"] if idx >= len(ids)]
+    touched = {idx: (int(ids[idx]), int(versions[idx])) for idx in [*changes["deleted_rows"], *changes["edited_rows"]] if idx < len(ids)}
+    user_id = current_user_id()
+
+    added, logs = [], []
+    for i, new_row in enumerate(changes["added_rows"]):
+        dist = new_row.get("distance") or 0; t_min = new_row.get("time_min") or 0
+        if not _is_number(dist) or not _is_number(t_min) or dist <= 0 or t_min <= 0:
+            errors.append(f"Row {len(ids) + i + 1}: distance and time must be positive to add a run.")
+            continue
+        run_date = str(to_day(new_row.get("date")))
+        added.append((user_id, run_date, dist, t_min, t_min / dist, new_row.get("note") or ""))
+        logs += _running_logs(run_date, dist, t_min / dist)
+
+    if errors: return errors
+    backend = get_backend()
+    with connect_db() as conn, conn.cursor() as cur:
+        try:
+            lock = _begin_locked(cur)
+            current = {}
+            if touched:
+                run_ids = sorted({run_id for run_id, _ in touched.values()})
+                cur.execute(f"SELECT id, wersja, data, dystans, czas_min, notatka FROM biegi WHERE user_id = %s AND id IN ({_placeholders(run_ids)}){lock}",
+                            [user_id] + run_ids)
+                current = {row[0]: row[1:] for row in cur.fetchall()}
+
+            conflicts, deleted_ids, updates = [], [], []
+            for idx in changes["deleted_rows"]:
+                if idx not in touched or touched[idx][0] not in current: continue
+                run_id, version = touched[idx]
+                if current[run_id][0] != version: conflicts.append(f"Row {idx + 1}: changed in another session, not deleted.")
+                else: deleted_ids.append(run_id)
+
+            for idx, row_changes in changes["edited_rows"].items():
+                run_id, version = touched[idx]
+                if run_id not in current:
+                    conflicts.append(f"Row {idx + 1}: deleted in another session.")
+                    continue
+                if current[run_id][0] != version:
+                    conflicts.append(f"Row {idx + 1}: changed in another session since this page was loaded.")
+                    continue
+                values = {col: row_changes.get(col, value) for col, value in zip(RUN_COLUMNS, current[run_id][1:])}
+                if not _is_number(values["distance"]) or not _is_number(values["time_min"]) or values["distance"] < 0 or values["time_min"] < 0:
+                    errors.append(f"Row {idx + 1}: distance and time must be non-negative numbers.")
+                    continue
+                if not values["date"]:
+                    errors.append(f"Row {idx + 1}: date is required.")
+                    continue
+                distance, time_min = float(values["distance"]), float(values["time_min"])
+                pace = time_min / distance if distance > 0 else 0
+                updates.append((run_id, user_id, str(to_day(values["date"])), distance, time_min, pace, values["note"] or "", version + 1))
+
+            if conflicts or errors:
+                conn.rollback()
+                if conflicts: invalidate("runs")
+                return conflicts + errors
+            if deleted_ids:
+                cur.execute(f"DELETE FROM biegi WHERE user_id = %s AND id IN ({_placeholders(deleted_ids)})", [user_id] + deleted_ids)
+            if updates:
+                backend.update_rows(cur, "biegi", ["id", "user_id"], ["data", "dystans", "czas_min", "tempo_min_km", "notatka", "wersja"],
+                                    ["int", "text", "date", "real", "real", "real", "text", "int"], updates)
+            if added:
+                backend.execute_values(cur, "INSERT INTO biegi (user_id, data, dystans, czas_min, tempo_min_km, notatka) VALUES %s",
+                                       added, template="(%s, %s::date, %s, %s, %s, %s)")
+                _insert_logs(cur, user_id, logs)
+            conn.commit()
+        except backend.Error as e:
+            conn.rollback()
+            return [f"Database error, nothing was saved: {e}"]
+    if deleted_ids or updates: _bump_run_generation()
+    invalidate("state", "chart", "runs")
+    return []
+
+RUN_PAGE_SIZE = 50
+RUN_CHART_POINTS = 400
+
+def _run_filters(start=None, end=None, after=None):
+    conditions, params = ["user_id = %s"], [current_user_id()]
+    if start: conditions.append("data >= %s"); params.append(str(start))
+    if end: conditions.append("data <= %s"); params.append(str(end))
+    if after: conditions.append("(data, id) < (%s, %s)"); params += [str(after[0]), int(after[1])]
+    return f"WHERE {' AND '.join(conditions)}", params
+
+@cached("runs")
+def get_run_history(start=None, end=None):
+    snapshot = get_local_snapshot()
+    if snapshot: return snapshot.run_history(start, end)
+    where, params = _run_filters(start, end)
+    query = f"""
+    SELECT id, data as date, dystans as distance, czas_min as time_min, tempo_min_km as pace, notatka as note, wersja as version
+    FROM biegi {where} ORDER BY data DESC, id DESC
     """
-    return pd.read_sql_query(query, conn)
+    with connect_db() as conn:
+        return pd.read_sql_query(query, conn, params=params)
+
+@cached("runs")
+def get_run_page(after=None, page_size=RUN_PAGE_SIZE, start=None, end=None):
+    snapshot = get_local_snapshot()
+    if snapshot: df = snapshot.run_history(start, end, after).head(page_size + 1)
+    else:
+        where, params = _run_filters(start, end, after)
+        query = f"""
+        SELECT id, data as date, dystans as distance, czas_min as time_min, tempo_min_km as pace, notatka as note, wersja as version
+        FROM biegi {where} ORDER BY data DESC, id DESC LIMIT %s
+        """
+        with connect_db() as conn:
+            df = pd.read_sql_query(query, conn, params=params + [page_size + 1])
+    if len(df) <= page_size: return df, None
+    df = df.iloc[:page_size]
+    last = df.iloc[-1]
+    return df, (last['date'], int(last['id']))
+
+@cached("runs")
+def get_run_chart_series(start=None, end=None, max_points=RUN_CHART_POINTS):
+    snapshot = get_local_snapshot()
+    if snapshot: return snapshot.run_chart_series(start, end, max_points)
+    where, params = _run_filters(start, end)
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT count(*), MIN(data), MAX(data) FROM biegi {where}", params)
+            total, first, last = cur.fetchone()
+        if total <= max_points:
+            query = f"SELECT data as date, tempo_min_km as pace, dystans as distance, 1 as runs, notatka as note FROM biegi {where}"
+            return pd.read_sql_query(query, conn, params=params)
+        bucket = "week" if (to_day(last) - to_day(first)).days / 7 <= max_points else "month"
+        query = f"""
+        SELECT {get_backend().date_bucket(bucket, "data")} as date,
+               SUM(czas_min) / NULLIF(SUM(dystans), 0) as pace, SUM(dystans) as distance, count(*) as runs,
+               count(*) || ' runs' as note
+        FROM biegi {where} GROUP BY 1 ORDER BY 1
+        """
+        return pd.read_sql_query(query, conn, params=params)
+
+ROLLING_PERIODS = {"Last 7 Days": 7, "Last 30 Days": 30, "Last 90 Days": 90, "Last 365 Days": 365}
 
 def get_sql_date_range(period):
     today = date.today()
     if period == "This Week": start = today - timedelta(days=today.weekday())
     elif period == "This Month": start = today.replace(day=1)
     elif period == "This Year": start = today.replace(month=1, day=1)
+    elif period in ROLLING_PERIODS: start = today - timedelta(days=ROLLING_PERIODS[period] - 1)
     else: start = today
     return str(start)
 
+def resolve_range(period=None, start=None, end=None):
+    if start is None: start = get_sql_date_range(period)
+    return to_day(start), to_day(end)
+
 def get_week_key(d=None):
-    if d is None: d = date.today()
-    return f"{d.year}-{d.isocalendar()[1]}"
+    return schema.week_key(d or date.today())
 
-def get_weeks_in_period(period):
-    today = date.today()
-    keys = set()
-    if period == "This Week": start = today - timedelta(days=today.weekday())
-    elif period == "This Month": start = today.replace(day=1)
-    elif period == "This Year": start = today.replace(month=1, day=1)
-    else: start = today
-    current = start
-    while current <= today:
-        keys.add(f"{current.year}-{current.isocalendar()[1]}")
-        current += timedelta(days=7)
-    keys.add(f"{today.year}-{today.isocalendar()[1]}")
-    return list(keys)
+def get_week_range(period=None, start=None, end=None):
+    start, end = resolve_range(period, start, end)
+    return get_week_key(start), get_week_key(end)
+
+@cached("goals")
+def calc_historical_goals(activity_list, period=None, start=None, end=None):
+    if not activity_list: return {}
+    first, last = get_week_range(period, start, end)
+    snapshot = get_local_snapshot()
+    if snapshot: return snapshot.historical_goals(activity_list, first, last)
+    with connect_db() as conn, conn.cursor() as cur:
+        act_placeholders = ','.join('%s' for _ in activity_list)
+        query = f"""
+        SELECT aktywnosc, SUM(wartosc) FROM cele
+        WHERE user_id = %s AND aktywnosc IN ({act_placeholders}) AND klucz_tygodnia BETWEEN %s AND %s
+        GROUP BY aktywnosc
+        """
+        cur.execute(query, [current_user_id()] + list(activity_list) + [first, last])
+        rows = cur.fetchall()
+    return {act: total for act, total in rows if total}
 
 def calc_historical_goal(activity, period):
-    keys = get_weeks_in_period(period)
-    if not keys: return 0
-    conn = connect_db()
-    with conn.cursor() as cur:
-        placeholders = ','.join('%s' for _ in keys)
-        query = f"SELECT SUM(wartosc) FROM cele WHERE aktywnosc = %s AND klucz_tygodnia IN ({placeholders})"
-        cur.execute(query, [activity] + keys)
-        result = cur.fetchone()[0]
-    return result if result else 0
-
-@st.cache_data(ttl=600) 
+    return calc_historical_goals([activity], period).get(activity, 0)
+
+@cached("config")
 def get_config():
-    conn = connect_db()
-    return pd.read_sql_query("SELECT nazwa as name, kategoria as category, czy_zly as is_bad FROM config_aktywnosci", conn)
+    with connect_db() as conn:
+        return pd.read_sql_query("SELECT nazwa as name, kategoria as category, czy_zly as is_bad FROM config_aktywnosci WHERE user_id = %s",
+                                 conn, params=(current_user_id(),))
 
+@cached("config", "goals")
 def get_full_planner():
-    conn = connect_db()
     key = get_week_key()
+    snapshot = get_local_snapshot()
+    if snapshot: return snapshot.full_planner(key)
     query = """
-    SELECT c.nazwa as "Activity", c.kategoria as "Category", c.czy_zly as "Is Bad Habit", COALESCE(t.wartosc, 0) as "Weekly Goal"
+    SELECT c.nazwa as "Activity", c.kategoria as "Category", c.czy_zly as "Is Bad Habit", COALESCE(t.wartosc, 0) as "Weekly Goal",
+           c.wersja as "Version", COALESCE(t.wersja, 0) as "Goal Version"
     FROM config_aktywnosci c
-    LEFT JOIN cele t ON c.nazwa = t.aktywnosc AND t.klucz_tygodnia = %s
+    LEFT JOIN cele t ON t.user_id = c.user_id AND c.nazwa = t.aktywnosc AND t.klucz_tygodnia = %s
+    WHERE c.user_id = %s
     ORDER BY c.kategoria, c.nazwa
     """
-    return pd.read_sql_query(query, conn, params=(key,))
+    with connect_db() as conn:
+        return pd.read_sql_query(query, conn, params=(key, current_user_id()))
+
+def _as_flag(value):
+    return 1 if (value is True or value == 1) else 0
+
+def planner_rows(df_plan):
+    return df_plan["Activity"].to_numpy(), df_plan.pop("Version").to_numpy(), df_plan.pop("Goal Version").to_numpy()
 
-def update_planner_batch(changes, df_snapshot):
-    conn = connect_db()
+def update_planner_batch(changes, rows):
+    names, versions, goal_versions = rows
     key = get_week_key()
-    
-    with conn.cursor() as cur:
-        for idx in changes["deleted_rows"]:
-            if idx < len(df_snapshot):
-                act_name = df_snapshot.iloc[idx]['Activity']
-                cur.execute("DELETE FROM config_aktywnosci WHERE nazwa = %s", (act_name,))
-                cur.execute("DELETE FROM cele WHERE aktywnosc = %s", (act_name,))
-            
-        for idx, row_changes in changes["edited_rows"].items():
-            if idx < len(df_snapshot):
-                original_row = df_snapshot.iloc[idx]
-                act_name = original_row['Activity']
-                
+    errors = []
+    touched = {idx: (names[idx], int(versions[idx]), int(goal_versions[idx]))
+               for idx in [*changes["deleted_rows"], *changes["edited_rows"]] if idx < len(names)}
+    configs, goals = {}, {}
+
+    for i, new_row in enumerate(changes["added_rows"]):
+        raw_name = new_row.get("Activity", "")
+        name = raw_name.strip() if raw_name else None
+        if not name:
+            errors.append(f"New row {i + 1}: activity name is required.")
+            continue
+
+        raw_cat = new_row.get("Category", "")
+        cat = raw_cat.strip() if raw_cat else "General"
+        configs[name] = (cat, _as_flag(new_row.get("Is Bad Habit", False)))
+
+        goal = new_row.get("Weekly Goal") or 0
+        if not _is_number(goal) or goal < 0:
+            errors.append(f"{name}: weekly goal must be a non-negative number.")
+        elif goal > 0:
+            goals[name] = goal
+
+    if errors: return errors
+    backend = get_backend()
+    user_id = current_user_id()
+    with connect_db() as conn, conn.cursor() as cur:
+        try:
+            lock = _begin_locked(cur, "c")
+            current = {}
+            if touched:
+                acts = sorted({name for name, _, _ in touched.values()})
+                cur.execute(f"""
+                    SELECT c.nazwa, c.wersja, COALESCE(t.wersja, 0), c.kategoria, c.czy_zly FROM config_aktywnosci c
+                    LEFT JOIN cele t ON t.user_id = c.user_id AND t.aktywnosc = c.nazwa AND t.klucz_tygodnia = %s
+                    WHERE c.user_id = %s AND c.nazwa IN ({_placeholders(acts)}){lock}
+                """, [key, user_id] + acts)
+                current = {row[0]: row[1:] for row in cur.fetchall()}
+
+            conflicts, deleted = [], []
+            for idx in changes["deleted_rows"]:
+                if idx not in touched or touched[idx][0] not in current: continue
+                act_name, version, goal_version = touched[idx]
+                if current[act_name][:2] != (version, goal_version): conflicts.append(f"{act_name}: changed in another session, not deleted.")
+                else: deleted.append(act_name)
+
+            for idx, row_changes in changes["edited_rows"].items():
+                if idx not in touched: continue
+                act_name, version, goal_version = touched[idx]
+                if act_name not in current:
+                    conflicts.append(f"{act_name}: deleted in another session.")
+                    continue
+                if current[act_name][:2] != (version, goal_version):
+                    conflicts.append(f"{act_name}: changed in another session since this page was loaded.")
+                    continue
+                category, bad = current[act_name][2:]
+
                 if "Category" in row_changes or "Is Bad Habit" in row_changes:
-                    new_cat = row_changes.get("Category", original_row['Category'])
-                    bad_val = row_changes.get("Is Bad Habit", original_row['Is Bad Habit'])
-                    new_bad = 1 if (bad_val is True or bad_val == 1) else 0
-                    cur.execute("UPDATE config_aktywnosci SET kategoria=%s, czy_zly=%s WHERE nazwa=%s", 
-                                (new_cat, new_bad, act_name))
-                
+                    new_cat = row_changes.get("Category", category)
+                    if not new_cat or not str(new_cat).strip():
+                        errors.append(f"{act_name}: category is required.")
+                        continue
+                    configs[act_name] = (str(new_cat).strip(), _as_flag(row_changes.get("Is Bad Habit", bad)))
+
                 if "Weekly Goal" in row_changes:
-                    new_goal = row_changes["Weekly Goal"]
-                    query_goal = """
-                        INSERT INTO cele (klucz_tygodnia, aktywnosc, wartosc) VALUES (%s, %s, %s)
-                        ON CONFLICT (klucz_tygodnia, aktywnosc) DO UPDATE SET wartosc = EXCLUDED.wartosc
-                    """
-                    cur.execute(query_goal, (key, act_name, new_goal))
-
-        for new_row in changes["added_rows"]:
-            raw_name = new_row.get("Activity", "")
-            name = raw_name.strip() if raw_name else None
-            
-            raw_cat = new_row.get("Category", "")
-            cat = raw_cat.strip() if raw_cat else "General"
-            
-            bad_val = new_row.get("Is Bad Habit", False)
-            bad = 1 if (bad_val is True or bad_val == 1) else 0
-            
-            goal = new_row.get("Weekly Goal", 0)
-            
-            if name:
-                try:
-                    query_ins = """
-                        INSERT INTO config_aktywnosci (nazwa, kategoria, czy_zly) VALUES (%s, %s, %s)
-                        ON CONFLICT (nazwa) DO UPDATE SET kategoria = EXCLUDED.kategoria, czy_zly = EXCLUDED.czy_zly
-                    """
-                    cur.execute(query_ins, (name, cat, bad))
-                    
-                    if goal > 0:
-                        query_goal = """
-                            INSERT INTO cele (klucz_tygodnia, aktywnosc, wartosc) VALUES (%s, %s, %s)
-                            ON CONFLICT (klucz_tygodnia, aktywnosc) DO UPDATE SET wartosc = EXCLUDED.wartosc
-                        """
-                        cur.execute(query_goal, (key, name, goal))
-                    
-                    st.toast(f"💾 Added/Updated: {name}")
-                except Exception as e:
-                    st.error(f"Database Error for '{name}': {e}")
+                    new_goal = row_changes["Weekly Goal"] or 0
+                    if not _is_number(new_goal) or new_goal < 0:
+                        errors.append(f"{act_name}: weekly goal must be a non-negative number.")
+                        continue
+                    goals[act_name] = new_goal
 
-        conn.commit()
-    st.cache_data.clear()
+            if conflicts or errors:
+                conn.rollback()
+                if conflicts: invalidate("config", "goals")
+                return conflicts + errors
+            if deleted:
+                cur.execute(f"DELETE FROM config_aktywnosci WHERE user_id = %s AND nazwa IN ({_placeholders(deleted)})", [user_id] + deleted)
+                cur.execute(f"DELETE FROM cele WHERE user_id = %s AND aktywnosc IN ({_placeholders(deleted)})", [user_id] + deleted)
+            if configs:
+                backend.execute_values(cur, """
+                    INSERT INTO config_aktywnosci (user_id, nazwa, kategoria, czy_zly) VALUES %s
+                    ON CONFLICT (user_id, nazwa) DO UPDATE SET kategoria = EXCLUDED.kategoria, czy_zly = EXCLUDED.czy_zly,
+                                                               wersja = config_aktywnosci.wersja + 1
+                """, [(user_id, name, cat, bad) for name, (cat, bad) in configs.items()])
+            if goals:
+                backend.execute_values(cur, """
+                    INSERT INTO cele (user_id, klucz_tygodnia, aktywnosc, wartosc) VALUES %s
+                    ON CONFLICT (user_id, klucz_tygodnia, aktywnosc) DO UPDATE SET wartosc = EXCLUDED.wartosc, wersja = cele.wersja + 1
+                """, [(user_id, key, name, goal) for name, goal in goals.items()])
+            conn.commit()
+        except backend.Error as e:
+            conn.rollback()
+            return [f"Database error, nothing was saved: {e}"]
+    invalidate("config", "goals")
+    return []
 
 def add_log(activity, amount):
-    conn = connect_db()
-    with conn.cursor() as cur:
-        cur.execute("INSERT INTO logi (data, aktywnosc, ilosc) VALUES (%s, %s, %s)", (str(date.today()), activity, amount))
+    today = str(date.today())
+    if st.session_state.get('write_behind'):
+        get_write_queue().enqueue(today, activity, amount)
+        return
+    with connect_db() as conn, conn.cursor() as cur:
+        _insert_logs(cur, current_user_id(), [(today, activity, amount)])
         conn.commit()
+    invalidate("state", "chart")
 
-def get_weekly_state_dict():
-    conn = connect_db()
-    start = get_sql_date_range("This Week")
-    df = pd.read_sql_query("SELECT aktywnosc, SUM(ilosc) as suma FROM logi WHERE data >= %s GROUP BY aktywnosc", conn, params=(start,))
+@cached("state")
+def _get_weekly_state():
+    with connect_db() as conn:
+        df = pd.read_sql_query("SELECT aktywnosc, suma FROM logi_tydzien WHERE user_id = %s AND klucz_tygodnia = %s",
+                               conn, params=(current_user_id(), get_week_key()))
     if df.empty: return {}
     return dict(zip(df.aktywnosc, df.suma))
 
+def get_weekly_state_dict():
+    state = _get_weekly_state()
+    key = get_week_key()
+    for day, activity, amount in _pending_logs():
+        if get_week_key(to_day(day)) == key: state[activity] = state.get(activity, 0) + amount
+    return state
+
+@cached("goals")
 def get_current_goals_dict():
-    conn = connect_db()
-    df = pd.read_sql_query("SELECT aktywnosc, wartosc FROM cele WHERE klucz_tygodnia = %s", conn, params=(get_week_key(),))
+    with connect_db() as conn:
+        df = pd.read_sql_query("SELECT aktywnosc, wartosc FROM cele WHERE user_id = %s AND klucz_tygodnia = %s",
+                               conn, params=(current_user_id(), get_week_key()))
     if df.empty: return {}
     return dict(zip(df.aktywnosc, df.wartosc))
 
-def get_chart_data(activity_list, period):
+TREND_BUCKETS = ("day", "week", "month")
+
+def pick_bucket(start, end):
+    days = (to_day(end) - to_day(start)).days
+    if days <= 92: return "day"
+    if days <= 731: return "week"
+    return "month"
+
+def _pending_in_range(activity_list, start, end):
+    return [(to_day(day), act, amount) for day, act, amount in _pending_logs()
+            if act in activity_list and start <= to_day(day) <= end]
+
+@cached("chart")
+def _get_activity_totals(activity_list, start, end):
+    if not activity_list: return {}
+    snapshot = get_local_snapshot()
+    if snapshot: return snapshot.activity_totals(activity_list, start, end)
+    query = f"""
+    SELECT aktywnosc, SUM(suma) FROM logi_dzien
+    WHERE user_id = %s AND data BETWEEN %s AND %s AND aktywnosc IN ({_placeholders(activity_list)})
+    GROUP BY aktywnosc
+    """
+    with connect_db() as conn, conn.cursor() as cur:
+        cur.execute(query, [current_user_id(), str(start), str(end)] + list(activity_list))
+        return dict(cur.fetchall())
+
+def get_activity_totals(activity_list, period=None, start=None, end=None):
+    start, end = resolve_range(period, start, end)
+    totals = _get_activity_totals(activity_list, start, end)
+    for _, act, amount in _pending_in_range(activity_list, start, end):
+        totals[act] = totals.get(act, 0) + amount
+    return totals
+
+@cached("chart")
+def _get_trend_rows(activity_list, start, end, bucket):
     if not activity_list: return pd.DataFrame(columns=['data', 'aktywnosc', 'ilosc'])
-    conn = connect_db()
-    start = get_sql_date_range(period)
-    placeholders = ','.join('%s' for _ in activity_list)
-    query = f"SELECT data, aktywnosc, ilosc FROM logi WHERE data >= %s AND aktywnosc IN ({placeholders})"
-    params = [start] + activity_list
-    df = pd.read_sql_query(query, conn, params=params)
+    snapshot = get_local_snapshot()
+    if snapshot: return snapshot.trend_rows(activity_list, start, end, bucket)
+    query = f"""
+    SELECT {get_backend().date_bucket(bucket, "data")} as data, aktywnosc, SUM(suma) as ilosc FROM logi_dzien
+    WHERE user_id = %s AND data BETWEEN %s AND %s AND aktywnosc IN ({_placeholders(activity_list)})
+    GROUP BY 1, 2 ORDER BY 1, 2
+    """
+    with connect_db() as conn:
+        df = pd.read_sql_query(query, conn, params=[current_user_id(), str(start), str(end)] + list(activity_list))
+    df['data'] = pd.to_datetime(df['data']).dt.date
+    return df
+
+def get_trend_series(activity_list, period=None, start=None, end=None, bucket=None):
+    start, end = resolve_range(period, start, end)
+    bucket = bucket or pick_bucket(start, end)
+    df = _get_trend_rows(activity_list, start, end, bucket)
+    pending = [(storage.bucket_start(day, bucket), act, amount) for day, act, amount in _pending_in_range(activity_list, start, end)]
+    if not pending: return df
+    df = pd.concat([df, pd.DataFrame(pending, columns=['data', 'aktywnosc', 'ilosc'])], ignore_index=True)
+    return df.groupby(['data', 'aktywnosc'], as_index=False)['ilosc'].sum()
+
+YOY_YEARS = 3
+
+def get_year_over_year(activity_list, years=YOY_YEARS, bucket="month"):
+    today = date.today()
+    df = get_trend_series(activity_list, start=date(today.year - years + 1, 1, 1), end=today, bucket=bucket)
+    df['rok'] = [d.year for d in df['data']]
+    df['okres'] = [d.month if bucket == "month" else d.isocalendar()[1] if bucket == "week" else d.timetuple().tm_yday for d in df['data']]
     return df
 
+def get_chart_data(activity_list, period=None, start=None, end=None, bucket="day"):
+    return get_trend_series(activity_list, period, start, end, bucket)
+
+CHART_PERIODS = ("This Week", "This Month", "This Year")
+CLIMBING_CATEGORIES = ("Bouldering", "Sport Climbing", "Baldy", "Liny")
+GRADE_ORDER = ["3", "4", "5", "5+", "6a", "6a+", "6b", "6b+", "6c", "6c+", "7a", "7a+", "7b", "7b+", "7c", "7c+", "8a", "8a+", "8b", "8b+", "8c", "9a"]
+
+GRADE_RANK = {grade: rank for rank, grade in enumerate(GRADE_ORDER)}
+
+class ActivityStructure:
+    __slots__ = ("categories", "bad_habits", "bad_categories", "grade_rank")
+
+    def __init__(self, rows):
+        categories = {}
+        for name, category, _ in rows: categories.setdefault(category, []).append(name)
+        self.grade_rank = {name: GRADE_RANK.get(str(name).lower(), len(GRADE_ORDER))
+                           for cat in CLIMBING_CATEGORIES for name in categories.get(cat, ())}
+        self.categories = {cat: tuple(sorted(names, key=self.grade_rank.get) if cat in CLIMBING_CATEGORIES else sorted(names))
+                           for cat, names in categories.items()}
+        self.bad_habits = frozenset(name for name, _, flag in rows if flag == 1)
+        self.bad_categories = frozenset(cat for cat, names in self.categories.items() if not self.bad_habits.isdisjoint(names))
+
+    def __deepcopy__(self, memo):
+        return self
+
+@cached("config")
+def get_activity_structure():
+    snapshot = get_local_snapshot()
+    if snapshot: return ActivityStructure(snapshot.config_rows())
+    with connect_db() as conn, conn.cursor() as cur:
+        cur.execute("SELECT nazwa, kategoria, czy_zly FROM config_aktywnosci WHERE user_id = %s", (current_user_id(),))
+        return ActivityStructure(cur.fetchall())
+
+@cached("goals", "state", "chart")
+def _get_dashboard_rows(periods):
+    key, user_id = get_week_key(), current_user_id()
+    snapshot = get_local_snapshot()
+    if snapshot:
+        today = date.today()
+        return snapshot.dashboard_rows(key, today - timedelta(days=today.weekday()),
+                                       [(period, to_day(get_sql_date_range(period)), *get_week_range(period)) for period in periods])
+    parts = [
+        "SELECT 'state' as kind, aktywnosc as name, NULL as label, suma as value FROM logi_tydzien WHERE user_id = %s AND klucz_tygodnia = %s",
+        "SELECT 'goal', aktywnosc, NULL, wartosc FROM cele WHERE user_id = %s AND klucz_tygodnia = %s",
+    ]
+    params = [user_id, key, user_id, key]
+    for period in periods:
+        parts.append("SELECT 'total', aktywnosc, %s, SUM(suma) FROM logi_dzien WHERE user_id = %s AND data >= %s GROUP BY aktywnosc")
+        parts.append("SELECT 'planned', aktywnosc, %s, SUM(wartosc) FROM cele WHERE user_id = %s AND klucz_tygodnia BETWEEN %s AND %s GROUP BY aktywnosc")
+        params += [period, user_id, get_sql_date_range(period), period, user_id, *get_week_range(period)]
+    with connect_db() as conn, conn.cursor() as cur:
+        cur.execute(" UNION ALL ".join(parts), params)
+        return cur.fetchall()
+
+def get_dashboard_snapshot(periods=CHART_PERIODS):
+    periods = tuple(periods)
+    state, goals = {}, {}
+    totals = {period: {} for period in periods}
+    planned = {period: {} for period in periods}
+    for kind, name, label, value in _get_dashboard_rows(periods):
+        if kind == 'state': state[name] = value
+        elif kind == 'goal': goals[name] = value
+        elif kind == 'total': totals[label][name] = value
+        elif value: planned[label][name] = value
+
+    key = get_week_key()
+    starts = {period: to_day(get_sql_date_range(period)) for period in periods}
+    for day, activity, amount in _pending_logs():
+        day = to_day(day)
+        if get_week_key(day) == key: state[activity] = state.get(activity, 0) + amount
+        for period, start in starts.items():
+            if day >= start: totals[period][activity] = totals[period].get(activity, 0) + amount
+
+    return {"state": state, "goals": goals, "totals": totals, "planned": planned}
+
+def chart_reads(activity_list, mode="Totals", period=None, start=None, end=None):
+    if mode == "Year over year":
+        today = date.today()
+        return [(_get_trend_rows, activity_list, date(today.year - YOY_YEARS + 1, 1, 1), today, "month")]
+    if mode == "Trend":
+        start, end = resolve_range(period, start, end)
+        return [(_get_trend_rows, activity_list, start, end, pick_bucket(start, end))]
+    if start is None and period in CHART_PERIODS: return [(_get_dashboard_rows, CHART_PERIODS)]
+    return [(_get_activity_totals, activity_list, *resolve_range(period, start, end)),
+            (calc_historical_goals, activity_list, period, start, end)]
+
 def rename_category_in_db(old_name, new_name):
-    conn = connect_db()
-    with conn.cursor() as cur:
-        cur.execute("UPDATE config_aktywnosci SET kategoria = %s WHERE kategoria = %s", (new_name, old_name))
+    with connect_db() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE config_aktywnosci SET kategoria = %s, wersja = wersja + 1 WHERE user_id = %s AND kategoria = %s", (new_name, current_user_id(), old_name))
         conn.commit()
-    st.cache_data.clear()
\ No newline at end of file
+    invalidate("config")
+
+instrumentation.trace_module(__name__, skip={"get_backend", "connect_db", "current_user_id", "tenant_scope", "cache_scope",
+                                             "cached", "invalidate", "get_local_snapshot", "get_snapshot_status", "prefetch", "chart_reads", "to_day",
+                                             "get_week_key", "get_sql_date_range", "get_week_range",
+                                             "resolve_range", "pick_bucket"})
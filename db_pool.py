@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import psycopg2
+import psycopg2.extensions
+
+POOL_SIZE = 5
+CHECKOUT_TIMEOUT = 30
+PING_AFTER_IDLE = 60
+CONNECT_RETRIES = 4
+BACKOFF_START = 0.25
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    def __init__(self, db_url, size=POOL_SIZE, connection_factory=None):
+        self.db_url = db_url
+        self.size = size
+        self.connection_factory = connection_factory
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        delay = BACKOFF_START
+        for attempt in range(CONNECT_RETRIES):
+            try:
+                return psycopg2.connect(self.db_url, connection_factory=self.connection_factory)
+            except psycopg2.OperationalError:
+                if attempt == CONNECT_RETRIES - 1: raise
+                time.sleep(delay)
+                delay *= 2
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed: return False
+        if time.monotonic() - idle_since < PING_AFTER_IDLE: return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _checkout(self):
+        if not self._slots.acquire(timeout=CHECKOUT_TIMEOUT):
+            raise PoolTimeout(f"No free database connection after {CHECKOUT_TIMEOUT}s (pool size {self.size})")
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle: break
+                    conn, idle_since = self._idle.pop()
+                if self._is_healthy(conn, idle_since): return conn
+                self._discard(conn)
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, conn, broken=False):
+        try:
+            if not broken and not conn.closed:
+                try:
+                    if conn.status != psycopg2.extensions.STATUS_READY: conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self._checkout()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._checkin(conn, broken)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self._discard(conn)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_url, **kwargs):
+    with _pools_lock:
+        pool = _pools.get(db_url)
+        if pool is None:
+            pool = _pools[db_url] = ConnectionPool(db_url, **kwargs)
+    return pool
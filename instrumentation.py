@@ -0,0 +1,232 @@
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from functools import wraps
+import psycopg2.extensions
+
+SLOW_QUERY_MS = 200
+SLOW_QUERY_LOG = "slow_queries.log"
+METRICS_FILE = "metrics/training_panel.prom"
+METRICS_INTERVAL = 15
+TOP_STATEMENTS = 10
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+_SKIP_FILES = {os.path.join(_ROOT, name) for name in ("instrumentation.py", "storage.py", "db_pool.py")}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%s|\?")
+_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_ROWS = re.compile(r"(?:\(\.\.\.\)\s*,\s*)+\(\.\.\.\)")
+_SPACE = re.compile(r"\s+")
+
+def fingerprint(sql):
+    if isinstance(sql, bytes): sql = sql.decode(errors="replace")
+    sql = _STRING.sub("?", str(sql))
+    sql = _NUMBER.sub("?", sql)
+    sql = _PARAM.sub("?", sql)
+    sql = _LIST.sub("(...)", sql)
+    sql = _ROWS.sub("(...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+def query_id(fp):
+    return hashlib.sha1(fp.encode()).hexdigest()[:10]
+
+def call_site():
+    frame = sys._getframe(2)
+    while frame:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_ROOT) and filename not in _SKIP_FILES:
+            return f"{os.path.relpath(filename, _ROOT)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = []
+        self.functions = {}
+        self.stale_reads = []
+
+    @property
+    def db_ms(self):
+        return sum(s[1] for s in self.statements)
+
+    @property
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def top_statements(self, limit=TOP_STATEMENTS):
+        grouped = {}
+        for fp, ms, rows, site in self.statements:
+            calls, total, total_rows, _ = grouped.get((fp, site), (0, 0.0, 0, site))
+            grouped[(fp, site)] = (calls + 1, total + ms, total_rows + (rows or 0), site)
+        ordered = sorted(grouped.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [{"statement": fp, "site": site, "calls": calls, "ms": round(total, 2), "rows": rows}
+                for (fp, _), (calls, total, rows, site) in ordered]
+
+    def function_table(self):
+        ordered = sorted(self.functions.items(), key=lambda item: item[1][1], reverse=True)
+        return [{"function": name, "calls": calls, "ms": round(total, 2), "statements": statements}
+                for name, (calls, total, statements) in ordered]
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements = {}
+        self.functions = {}
+        self.slow = 0
+        self.stale = 0
+        self._written = 0.0
+
+    def record_statement(self, fp, ms, rows):
+        with self._lock:
+            calls, total, total_rows = self.statements.get(fp, (0, 0.0, 0))
+            self.statements[fp] = (calls + 1, total + ms, total_rows + (rows or 0))
+
+    def record_function(self, name, ms):
+        with self._lock:
+            calls, total = self.functions.get(name, (0, 0.0))
+            self.functions[name] = (calls + 1, total + ms)
+
+    def render(self):
+        with self._lock:
+            statements, functions, slow, stale = dict(self.statements), dict(self.functions), self.slow, self.stale
+        lines = [
+            "# HELP training_db_statement_seconds Time spent executing SQL statements, by fingerprint.",
+            "# TYPE training_db_statement_seconds summary",
+        ]
+        for fp, (calls, total, _) in statements.items():
+            labels = f'query="{query_id(fp)}",statement="{_escape(fp[:200])}"'
+            lines.append(f"training_db_statement_seconds_sum{{{labels}}} {total / 1000:.6f}")
+            lines.append(f"training_db_statement_seconds_count{{{labels}}} {calls}")
+        lines += ["# HELP training_db_statement_rows_total Rows returned or affected by SQL statements.",
+                  "# TYPE training_db_statement_rows_total counter"]
+        for fp, (_, _, rows) in statements.items():
+            lines.append(f'training_db_statement_rows_total{{query="{query_id(fp)}"}} {rows}')
+        lines += ["# HELP training_db_function_seconds Time spent in database.py functions, including cache hits.",
+                  "# TYPE training_db_function_seconds summary"]
+        for name, (calls, total) in functions.items():
+            lines.append(f'training_db_function_seconds_sum{{function="{name}"}} {total / 1000:.6f}')
+            lines.append(f'training_db_function_seconds_count{{function="{name}"}} {calls}')
+        lines += ["# HELP training_db_slow_statements_total Statements slower than the slow-query threshold.",
+                  "# TYPE training_db_slow_statements_total counter",
+                  f"training_db_slow_statements_total {slow}",
+                  "# HELP training_db_stale_reads_total Cached reads served past their deadline while a query was still running.",
+                  "# TYPE training_db_stale_reads_total counter",
+                  f"training_db_stale_reads_total {stale}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None, force=False):
+        path = path or METRICS_FILE
+        now = time.monotonic()
+        if not path or (not force and now - self._written < METRICS_INTERVAL): return False
+        self._written = now
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+        return True
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+metrics = Metrics()
+_local = threading.local()
+
+slow_log = logging.getLogger("training_panel.slow_queries")
+slow_log.propagate = False
+
+def configure(slow_query_ms=None, slow_query_log=None, metrics_file=None):
+    global SLOW_QUERY_MS, METRICS_FILE
+    if slow_query_ms is not None: SLOW_QUERY_MS = float(slow_query_ms)
+    if metrics_file is not None: METRICS_FILE = metrics_file
+    path = os.path.abspath(slow_query_log or SLOW_QUERY_LOG)
+    if not any(getattr(h, "baseFilename", None) == path for h in slow_log.handlers):
+        for handler in list(slow_log.handlers):
+            slow_log.removeHandler(handler)
+            handler.close()
+        handler = logging.FileHandler(path, delay=True)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_log.addHandler(handler)
+        slow_log.setLevel(logging.INFO)
+
+def start_trace():
+    _local.trace = Trace()
+    return _local.trace
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+def end_trace():
+    trace = current_trace()
+    _local.trace = None
+    return trace
+
+def use_trace(trace):
+    _local.trace = trace
+
+def record_stale(name):
+    metrics.stale += 1
+    trace = current_trace()
+    if trace is not None: trace.stale_reads.append(name)
+
+def record_statement(sql, ms, rows):
+    fp = fingerprint(sql)
+    site = call_site()
+    if rows is not None and rows < 0: rows = None
+    metrics.record_statement(fp, ms, rows)
+    trace = current_trace()
+    if trace is not None:
+        trace.statements.append((fp, ms, rows, site))
+    if ms >= SLOW_QUERY_MS:
+        metrics.slow += 1
+        slow_log.info("%.1fms rows=%s site=%s query=%s %s", ms, rows, site, query_id(fp), fp)
+
+def timed_statement(execute):
+    @wraps(execute)
+    def wrapper(self, sql, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return execute(self, sql, *args, **kwargs)
+        finally:
+            record_statement(sql, (time.perf_counter() - started) * 1000, self.rowcount)
+    return wrapper
+
+def traced(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        trace = current_trace()
+        before = len(trace.statements) if trace else 0
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            metrics.record_function(func.__name__, ms)
+            if trace:
+                calls, total, statements = trace.functions.get(func.__name__, (0, 0.0, 0))
+                trace.functions[func.__name__] = (calls + 1, total + ms, statements + len(trace.statements) - before)
+    return wrapper
+
+def trace_module(module_name, skip=()):
+    module = sys.modules[module_name]
+    for name, value in list(vars(module).items()):
+        if name.startswith("_") or name in skip or isinstance(value, type) or not callable(value): continue
+        if getattr(value, "__module__", None) == module_name:
+            setattr(module, name, traced(value))
+
+class TracingCursor(psycopg2.extensions.cursor):
+    execute = timed_statement(psycopg2.extensions.cursor.execute)
+    executemany = timed_statement(psycopg2.extensions.cursor.executemany)
+    copy_expert = timed_statement(psycopg2.extensions.cursor.copy_expert)
+
+class TracingConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault("cursor_factory", TracingCursor)
+        return super().cursor(*args, **kwargs)
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc
+import storage
+
+SNAPSHOT_DIR = ".snapshots"
+SYNC_INTERVAL = 30.0
+RETRY_INTERVAL = 30.0
+MAX_SEGMENTS = 16
+ID_BATCH = 1000
+FORMAT = 2
+
+APPENDED = {
+    "logi": pa.schema([("id", pa.int64()), ("data", pa.date32()), ("aktywnosc", pa.string()), ("ilosc", pa.float64())]),
+    "biegi": pa.schema([("id", pa.int64()), ("data", pa.date32()), ("dystans", pa.float64()), ("czas_min", pa.float64()),
+                        ("tempo_min_km", pa.float64()), ("notatka", pa.string()), ("wersja", pa.int64())]),
+}
+REPLACED = {
+    "cele": pa.schema([("klucz_tygodnia", pa.int64()), ("aktywnosc", pa.string()), ("wartosc", pa.float64()), ("wersja", pa.int64())]),
+    "config_aktywnosci": pa.schema([("nazwa", pa.string()), ("kategoria", pa.string()), ("czy_zly", pa.int64()), ("wersja", pa.int64())]),
+}
+SCHEMAS = {**APPENDED, **REPLACED}
+TABLE_TAGS = {"logi": ("state", "chart"), "biegi": ("runs",), "cele": ("goals",), "config_aktywnosci": ("config",)}
+RUN_COLUMNS = {"data": "date", "dystans": "distance", "czas_min": "time_min", "tempo_min_km": "pace", "notatka": "note", "wersja": "version"}
+
+def _day(value):
+    if value is None or type(value) is date: return value
+    return date.fromisoformat(str(value)[:10])
+
+def _to_arrow(schema, rows):
+    columns = list(zip(*rows)) if rows else [() for _ in schema]
+    return pa.Table.from_arrays([pa.array([_day(v) for v in col] if field.type == pa.date32() else col, type=field.type)
+                                 for field, col in zip(schema, columns)], schema=schema)
+
+def _where(table, start=None, end=None, names=None, column="data"):
+    expr = pc.scalar(True)
+    if start is not None: expr &= pc.field(column) >= start
+    if end is not None: expr &= pc.field(column) <= end
+    if names is not None: expr &= pc.field("aktywnosc").isin(list(names))
+    return table.filter(expr)
+
+def _sums(table, value):
+    if not table.num_rows: return {}
+    grouped = table.group_by("aktywnosc").aggregate([(value, "sum")])
+    return dict(zip(grouped["aktywnosc"].to_pylist(), grouped[f"{value}_sum"].to_pylist()))
+
+class LocalSnapshot:
+    def __init__(self, scope, connect, user_id, directory=SNAPSHOT_DIR):
+        self.path = os.path.join(directory, hashlib.sha1(scope.encode()).hexdigest()[:16])
+        os.makedirs(self.path, exist_ok=True)
+        self.user_id = user_id
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._daily = (None, None)
+        self._reload = set()
+        self._garbage = []
+        self._stale = True
+        self._attempted = 0.0
+        self._meta = self._read_meta()
+        self.synced_at = self._meta["synced_at"]
+        self.last_error = None
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.path, "meta.json")) as f: meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        if meta.get("format") != FORMAT: meta = {"format": FORMAT, "seq": 0, "synced_at": None, "tables": {}}
+        listed = {name for info in meta["tables"].values() for name in info["files"]}
+        for name in os.listdir(self.path):
+            if name.endswith(".arrow") and name not in listed: os.remove(os.path.join(self.path, name))
+        return meta
+
+    def _write_meta(self):
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w") as f: json.dump(self._meta, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def _info(self, name):
+        return self._meta["tables"].setdefault(name, {"files": [], "last_id": 0})
+
+    def _load(self, name):
+        table = self._tables.get(name)
+        if table is None:
+            parts = [pa.ipc.open_file(pa.memory_map(os.path.join(self.path, f))).read_all() for f in self._info(name)["files"]]
+            table = self._tables[name] = pa.concat_tables(parts) if parts else SCHEMAS[name].empty_table()
+        return table
+
+    def _segment(self, name, table):
+        self._meta["seq"] += 1
+        filename = f"{name}-{self._meta['seq']}.arrow"
+        with pa.OSFile(os.path.join(self.path, filename), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        return filename
+
+    def _replace(self, name, table):
+        info = self._info(name)
+        old, info["files"] = info["files"], [self._segment(name, table)]
+        self._tables.pop(name, None)
+        self._garbage += old
+
+    def _append(self, name, table):
+        info = self._info(name)
+        info["files"].append(self._segment(name, table))
+        self._tables.pop(name, None)
+        if len(info["files"]) > MAX_SEGMENTS: self._replace(name, self._load(name))
+
+    def _sync_appended(self, cur, name, reload):
+        schema, info = APPENDED[name], self._info(name)
+        if reload:
+            self._replace(name, schema.empty_table())
+            info["last_id"] = 0
+        columns = ", ".join(schema.names)
+        keys = [key for key in ("id", "wersja") if key in schema.names]
+        cur.execute(f"SELECT count(*), COALESCE(MAX(id), 0), COALESCE(SUM({keys[-1]}), 0) FROM {name} WHERE user_id = %s", (self.user_id,))
+        total, max_id, checksum = cur.fetchone()
+        changed = reload
+        if max_id > info["last_id"]:
+            cur.execute(f"SELECT {columns} FROM {name} WHERE user_id = %s AND id > %s AND id <= %s ORDER BY id",
+                        (self.user_id, info["last_id"], max_id))
+            self._append(name, _to_arrow(schema, cur.fetchall()))
+            info["last_id"] = max_id
+            changed = True
+        local = self._load(name)
+        if local.num_rows == total and (pc.sum(local[keys[-1]]).as_py() or 0) == checksum: return changed
+
+        cur.execute(f"SELECT {', '.join(keys)} FROM {name} WHERE user_id = %s", (self.user_id,))
+        remote = _to_arrow(pa.schema([schema.field(key) for key in keys]), cur.fetchall())
+        kept = local.join(remote, keys, join_type="left semi")
+        missing = remote["id"].filter(pc.invert(pc.is_in(remote["id"], value_set=kept["id"]))).to_pylist()
+        parts = [kept]
+        for i in range(0, len(missing), ID_BATCH):
+            batch = missing[i:i + ID_BATCH]
+            cur.execute(f"SELECT {columns} FROM {name} WHERE user_id = %s AND id IN ({','.join('%s' for _ in batch)})",
+                        [self.user_id] + batch)
+            parts.append(_to_arrow(schema, cur.fetchall()))
+        table = pa.concat_tables(parts).sort_by("id")
+        self._replace(name, table)
+        info["last_id"] = max(info["last_id"], pc.max(table["id"]).as_py() or 0)
+        return True
+
+    def _sync(self):
+        reload, self._reload = self._reload, set()
+        changed = set()
+        with self._connect() as conn, conn.cursor() as cur:
+            for name in APPENDED:
+                if self._sync_appended(cur, name, name in reload): changed.add(name)
+            for name, schema in REPLACED.items():
+                cur.execute(f"SELECT {', '.join(schema.names)} FROM {name} WHERE user_id = %s", (self.user_id,))
+                table = _to_arrow(schema, cur.fetchall())
+                if not table.equals(self._load(name)):
+                    self._replace(name, table)
+                    changed.add(name)
+        return changed
+
+    def refresh(self, max_age=None):
+        with self._lock:
+            now = time.time()
+            due = self._stale or self.synced_at is None or (max_age is not None and now - self.synced_at >= max_age)
+            if not due or (self.last_error and now - self._attempted < RETRY_INTERVAL): return set()
+            self._attempted, self._stale = now, False
+            try:
+                changed = self._sync()
+            except Exception as e:
+                self._stale = True
+                if self.synced_at is None: raise
+                self.last_error = str(e)
+                return set()
+            self.last_error = None
+            self.synced_at = self._meta["synced_at"] = now
+            self._write_meta()
+            for filename in self._garbage:
+                try: os.remove(os.path.join(self.path, filename))
+                except OSError: pass
+            self._garbage = []
+            return changed
+
+    def mark_stale(self, reload=()):
+        self._reload.update(reload)
+        self._stale = True
+
+    def mark_offline(self, error):
+        if self.synced_at is None: return False
+        self.last_error, self._attempted = str(error), time.time()
+        return True
+
+    def table(self, name):
+        self.refresh()
+        with self._lock:
+            return self._load(name)
+
+    def daily(self):
+        logs = self.table("logi")
+        source, daily = self._daily
+        if source is not logs:
+            grouped = logs.group_by(["data", "aktywnosc"]).aggregate([("ilosc", "sum")])
+            daily = pa.table({"data": grouped["data"], "aktywnosc": grouped["aktywnosc"], "ilosc": grouped["ilosc_sum"]})
+            self._daily = (logs, daily)
+        return daily
+
+    def config_rows(self):
+        config = self.table("config_aktywnosci").select(["nazwa", "kategoria", "czy_zly"])
+        return list(zip(*(column.to_pylist() for column in config.columns)))
+
+    def dashboard_rows(self, week_key, week_start, periods):
+        logs, goals = self.daily(), self.table("cele")
+        current_goals = _where(goals, week_key, week_key, column="klucz_tygodnia")
+        rows = [("state", act, None, value) for act, value in _sums(_where(logs, week_start, week_start + timedelta(days=6)), "ilosc").items()]
+        rows += [("goal", act, None, value) for act, value in zip(current_goals["aktywnosc"].to_pylist(), current_goals["wartosc"].to_pylist())]
+        for period, start, first, last in periods:
+            rows += [("total", act, period, value) for act, value in _sums(_where(logs, start), "ilosc").items()]
+            rows += [("planned", act, period, value) for act, value in _sums(_where(goals, first, last, column="klucz_tygodnia"), "wartosc").items()]
+        return rows
+
+    def activity_totals(self, activity_list, start, end):
+        return _sums(_where(self.daily(), start, end, activity_list), "ilosc")
+
+    def trend_rows(self, activity_list, start, end, bucket):
+        df = _where(self.daily(), start, end, activity_list).to_pandas()
+        if bucket != "day": df["data"] = [storage.bucket_start(d, bucket) for d in df["data"]]
+        return df.groupby(["data", "aktywnosc"], as_index=False)["ilosc"].sum()
+
+    def historical_goals(self, activity_list, first, last):
+        totals = _sums(_where(self.table("cele"), first, last, activity_list, column="klucz_tygodnia"), "wartosc")
+        return {act: total for act, total in totals.items() if total}
+
+    def full_planner(self, week_key):
+        config = self.table("config_aktywnosci").to_pandas()
+        goals = _where(self.table("cele"), week_key, week_key, column="klucz_tygodnia").to_pandas()
+        df = config.merge(goals[["aktywnosc", "wartosc", "wersja"]], left_on="nazwa", right_on="aktywnosc", how="left", suffixes=("", "_cel"))
+        return pd.DataFrame({"Activity": df["nazwa"], "Category": df["kategoria"], "Is Bad Habit": df["czy_zly"],
+                             "Weekly Goal": df["wartosc"].fillna(0), "Version": df["wersja"],
+                             "Goal Version": df["wersja_cel"].fillna(0).astype("int64")}).sort_values(["Category", "Activity"], ignore_index=True)
+
+    def run_history(self, start=None, end=None, after=None):
+        df = _where(self.table("biegi"), _day(start), _day(end)).to_pandas().rename(columns=RUN_COLUMNS)
+        df["note"] = df["note"].astype(object).where(df["note"].notna(), None)
+        df = df.sort_values(["date", "id"], ascending=False, ignore_index=True)
+        if after:
+            day, run_id = _day(after[0]), int(after[1])
+            df = df[(df["date"] < day) | ((df["date"] == day) & (df["id"] < run_id))].reset_index(drop=True)
+        return df
+
+    def run_chart_series(self, start, end, max_points):
+        df = self.run_history(start, end)
+        if len(df) <= max_points: return df.assign(runs=1)[["date", "pace", "distance", "runs", "note"]]
+        bucket = "week" if (df["date"].max() - df["date"].min()).days / 7 <= max_points else "month"
+        df["date"] = [storage.bucket_start(d, bucket) for d in df["date"]]
+        df = df.groupby("date", as_index=False).agg(minutes=("time_min", "sum"), distance=("distance", "sum"), runs=("id", "count"))
+        df["pace"] = df["minutes"] / df["distance"].replace(0, np.nan)
+        df["note"] = df["runs"].astype(str) + " runs"
+        return df[["date", "pace", "distance", "runs", "note"]]
+
+    def run_totals(self):
+        ids = self.table("biegi")["id"]
+        return len(ids), pc.max(ids).as_py() or 0
+
+    def runs_after(self, after_id):
+        runs = self.table("biegi")
+        return runs.filter(pc.field("id") > after_id).select(["id", "data", "dystans", "czas_min"]).sort_by("id").to_pandas()
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+def peek_snapshot(scope):
+    with _snapshots_lock:
+        return _snapshots.get(scope)
+
+def get_snapshot(scope, connect, user_id):
+    with _snapshots_lock:
+        snapshot = _snapshots.get(scope)
+        if snapshot is None:
+            snapshot = _snapshots[scope] = LocalSnapshot(scope, connect, user_id)
+    return snapshot
+
+def mark_stale(scope, reload=()):
+    snapshot = peek_snapshot(scope)
+    if snapshot: snapshot.mark_stale(reload)
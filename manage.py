@@ -0,0 +1,105 @@
+import argparse
+import logging
+import os
+import sys
+import streamlit as st
+import bulk_io
+import database
+
+def cmd_rebuild_rollups(args):
+    groups = database.rebuild_rollups()
+    print(f"Rollups rebuilt from {groups} day/activity groups.")
+
+def cmd_compact_logs(args):
+    merged = database.compact_logs(st.session_state['db_url'], database.current_user_id(), args.before)
+    print(f"Merged {merged} log rows into their day/activity totals.")
+
+def _open(path, mode):
+    if path == "-": return sys.stdin if "r" in mode else sys.stdout
+    return open(path, mode, newline="")
+
+def cmd_import_logs(args):
+    with _open(args.file, "r") as stream:
+        inserted = bulk_io.import_logs_csv(stream)
+    print(f"Imported {inserted} log rows.", file=sys.stderr)
+
+def cmd_import_runs(args):
+    activity_files = [p for p in args.files if os.path.splitext(p)[1].lower() in (".gpx", ".tcx")]
+    csv_files = [p for p in args.files if p not in activity_files]
+    inserted = 0
+    for path in csv_files:
+        with _open(path, "r") as stream:
+            inserted += bulk_io.import_runs_csv(stream, with_logs=not args.skip_running_logs)
+    if activity_files:
+        inserted += bulk_io.import_activity_files(activity_files, with_logs=not args.skip_running_logs)
+    print(f"Imported {inserted} runs.", file=sys.stderr)
+
+def cmd_export_logs(args):
+    with _open(args.file, "w") as out:
+        bulk_io.export_logs(out)
+
+def cmd_export_runs(args):
+    with _open(args.file, "w") as out:
+        bulk_io.export_runs(out)
+
+def cmd_merge_tenants(args):
+    profiles = args.profiles or list(st.secrets["db_urls"])
+    for profile in profiles:
+        name, _, source_url = profile.partition("=")
+        source_url = source_url or st.secrets["db_urls"][name]
+        counts = bulk_io.merge_tenant(source_url, st.session_state['db_url'], name, args.source_user_id)
+        print(f"{name}: " + ", ".join(f"{count} {table}" for table, count in counts.items()), file=sys.stderr)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Training Panel PRO maintenance commands.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--user", help="profile name from [db_urls] in secrets.toml")
+    target.add_argument("--db-url", help="explicit database URL")
+    parser.add_argument("--user-id", help="tenant inside a shared database (defaults to --user when shared_db_url is set)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-rollups", help="recompute the daily/weekly logi rollups from raw logs")
+    rebuild.set_defaults(func=cmd_rebuild_rollups)
+
+    compact = commands.add_parser("compact-logs", help="merge each closed day's logi rows into one row per activity, archiving the originals")
+    compact.add_argument("--before", help="compact days before this date (default: today)")
+    compact.set_defaults(func=cmd_compact_logs)
+
+    import_logs = commands.add_parser("import-logs", help="COPY a date,activity,amount CSV into logi")
+    import_logs.add_argument("file", help="CSV path, or - for stdin")
+    import_logs.set_defaults(func=cmd_import_logs)
+
+    import_runs = commands.add_parser("import-runs", help="COPY runs from date,distance,time_min,note CSVs or GPX/TCX files")
+    import_runs.add_argument("files", nargs="+", help="CSV, GPX or TCX paths (- reads CSV from stdin)")
+    import_runs.add_argument("--skip-running-logs", action="store_true", help="do not add the Running (km)/(pace) logs")
+    import_runs.set_defaults(func=cmd_import_runs)
+
+    export_logs = commands.add_parser("export-logs", help="COPY the full logi history out as CSV")
+    export_logs.add_argument("file", nargs="?", default="-")
+    export_logs.set_defaults(func=cmd_export_logs)
+
+    export_runs = commands.add_parser("export-runs", help="COPY the full biegi history out as CSV")
+    export_runs.add_argument("file", nargs="?", default="-")
+    export_runs.set_defaults(func=cmd_export_runs)
+
+    merge = commands.add_parser("merge-tenants", help="copy per-profile databases into the shared multi-tenant database")
+    merge.add_argument("profiles", nargs="*", help="PROFILE or PROFILE=URL (default: every [db_urls] entry)")
+    merge.add_argument("--source-user-id", default="", help="tenant to read from the source databases")
+    merge.set_defaults(func=cmd_merge_tenants)
+    return parser
+
+def resolve_target(args):
+    if args.db_url: return args.db_url, args.user_id or ""
+    shared_db_url = st.secrets.get("shared_db_url")
+    if shared_db_url: return shared_db_url, args.user_id or args.user
+    return st.secrets["db_urls"][args.user], args.user_id or ""
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.disable(logging.WARNING)
+    st.session_state['db_url'], st.session_state['user_id'] = resolve_target(args)
+    database.init_db()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+from datetime import date
+from functools import wraps
+import instrumentation
+
+MAX_ENTRIES = 512
+DEFAULT_TTL = 600
+
+class QueryCache:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._stale = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            expires_at, tags, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _generation(self, scope, tags):
+        return tuple(self._generations.get(k, 0) for k in ((None, None), (scope, None), *((scope, tag) for tag in sorted(tags))))
+
+    def generation(self, scope, tags):
+        with self._lock:
+            return self._generation(scope, tags)
+
+    def _bump(self, *keys):
+        for k in keys: self._generations[k] = self._generations.get(k, 0) + 1
+
+    def set(self, key, value, tags, ttl=DEFAULT_TTL, generation=None):
+        with self._lock:
+            # A load that started before an invalidate of one of its tags must not store what it read.
+            if generation is not None and generation != self._generation(key[0], tags): return False
+            self._entries[key] = (time.monotonic() + ttl, frozenset(tags), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._stale[key] = value
+            self._stale.move_to_end(key)
+            while len(self._stale) > self.max_entries:
+                self._stale.popitem(last=False)
+            return True
+
+    def stale(self, key):
+        with self._lock:
+            if key not in self._stale: return None
+            return (self._stale[key],)
+
+    def invalidate(self, scope, tags):
+        tags = set(tags)
+        with self._lock:
+            self._bump(*((scope, tag) for tag in tags))
+            stale = [key for key, entry in self._entries.items() if key[0] == scope and entry[1] & tags]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self, scope=None):
+        with self._lock:
+            self._bump((scope, None))
+            if scope is None:
+                self._entries.clear()
+                self._stale.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == scope]:
+                    del self._entries[key]
+                for key in [key for key in self._stale if key[0] == scope]:
+                    del self._stale[key]
+
+    def scopes(self):
+        with self._lock:
+            return {key[0] for key in self._entries}
+
+    def __len__(self):
+        return len(self._entries)
+
+cache = QueryCache()
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)): return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)): return frozenset(value)
+    if isinstance(value, dict): return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _claim(key, tags, deadline=None):
+    generation = cache.generation(key[0], tags)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        # A load started before the last invalidate would hand back pre-write data, so start a fresh one instead.
+        if future is not None and future.generation == generation: return future, False
+        future = _inflight[key] = Future()
+        future.deadline, future.generation = deadline, generation
+        return future, True
+
+def _fill(key, future, load, tags, ttl):
+    try:
+        value = load()
+        cache.set(key, value, tags, ttl, future.generation)
+        future.set_result(value)
+        return value
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            if _inflight.get(key) is future: del _inflight[key]
+
+def _await(key, future):
+    timeout = None if future.deadline is None else max(0.0, future.deadline - time.monotonic())
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        stale = cache.stale(key)
+        if stale is None: return future.result()
+        instrumentation.record_stale(key[1])
+        return stale[0]
+
+def _ttl(ttl):
+    return ttl() if callable(ttl) else ttl
+
+def cached(scope, *tags, ttl=DEFAULT_TTL):
+    def decorator(func):
+        def key_for(args, kwargs):
+            current = scope()
+            if current is None: return None
+            return (current, func.__qualname__, date.today(), _freeze(args), _freeze(kwargs))
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = key_for(args, kwargs)
+            if key is None: return func(*args, **kwargs)
+            entry = cache.get(key)
+            if entry is not None: return copy.deepcopy(entry[2])
+            future, owner = _claim(key, tags)
+            if owner: return copy.deepcopy(_fill(key, future, lambda: func(*args, **kwargs), tags, _ttl(ttl)))
+            return copy.deepcopy(_await(key, future))
+
+        def prefetch(submit, deadline, *args, **kwargs):
+            key = key_for(args, kwargs)
+            if key is None or cache.get(key) is not None: return None
+            future, owner = _claim(key, tags, deadline)
+            if owner:
+                entry_ttl = _ttl(ttl)
+                submit(lambda: _fill(key, future, lambda: func(*args, **kwargs), tags, entry_ttl))
+            return future
+
+        wrapper.prefetch = prefetch
+        return wrapper
+    return decorator
+
+def invalidate(scope, *tags):
+    return cache.invalidate(scope, tags)
@@ -0,0 +1,123 @@
+import threading
+from datetime import date
+import numpy as np
+import pandas as pd
+import database
+
+DISTANCE_BRACKETS = [("1K", 1.0), ("5K", 5.0), ("10K", 10.0), ("Half", 21.0975), ("Marathon", 42.195)]
+BRACKET_TOLERANCE = 0.98
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+PACE_TREND_WEEKS = 26
+
+class RunAnalytics:
+    def __init__(self, generation=None):
+        self.generation = generation
+        self.last_id = 0
+        self.count = 0
+        self.daily = pd.DataFrame(columns=["km", "minutes", "runs"], dtype=float)
+        self.bests = pd.DataFrame(columns=["minutes", "date", "distance", "pace"])
+
+    def update(self, runs):
+        if runs.empty: return
+        self.last_id = max(self.last_id, int(runs["id"].max()))
+        runs = runs[(runs["dystans"] > 0) & (runs["czas_min"] > 0)]
+        if runs.empty: return
+        days = pd.to_datetime(runs["data"])
+        new_daily = pd.DataFrame({"km": runs["dystans"].to_numpy(), "minutes": runs["czas_min"].to_numpy(), "runs": 1.0},
+                                 index=days).groupby(level=0).sum()
+        self.daily = new_daily if self.daily.empty else self.daily.add(new_daily, fill_value=0)
+        self.daily = self.daily.sort_index()
+
+        pace = (runs["czas_min"] / runs["dystans"]).to_numpy()
+        distance = runs["dystans"].to_numpy()
+        rows = {}
+        for label, target in DISTANCE_BRACKETS:
+            eligible = distance >= target * BRACKET_TOLERANCE
+            if not eligible.any(): continue
+            i = np.flatnonzero(eligible)[np.argmin(pace[eligible])]
+            rows[label] = (pace[i] * target, days.iloc[i].date(), distance[i], pace[i])
+        if not rows: return
+        candidates = pd.DataFrame.from_dict(rows, orient="index", columns=self.bests.columns)
+        if not self.bests.empty:
+            candidates = pd.concat([self.bests, candidates]).sort_values("minutes")
+        self.bests = candidates[~candidates.index.duplicated()]
+
+    def mileage(self, today=None):
+        if self.daily.empty: return pd.DataFrame(columns=["km", "acute", "chronic", "acwr"])
+        end = pd.Timestamp(today or date.today())
+        days = self.daily["km"].reindex(pd.date_range(self.daily.index.min(), max(end, self.daily.index.max()), freq="D"), fill_value=0)
+        acute = days.rolling(ACUTE_DAYS, min_periods=1).sum()
+        chronic = days.rolling(CHRONIC_DAYS, min_periods=1).sum()
+        weekly_chronic = chronic / (CHRONIC_DAYS / ACUTE_DAYS)
+        return pd.DataFrame({"km": days, "acute": acute, "chronic": chronic,
+                             "acwr": (acute / weekly_chronic.replace(0, np.nan)).round(2)})
+
+    def weekly_pace(self, weeks=PACE_TREND_WEEKS):
+        if self.daily.empty: return pd.DataFrame(columns=["week", "pace", "trend", "km"])
+        weekly = self.daily.resample("W-MON", label="left", closed="left").sum()
+        weekly = weekly[weekly["km"] > 0].tail(weeks)
+        pace = weekly["minutes"] / weekly["km"]
+        return pd.DataFrame({"week": weekly.index.date, "pace": pace.round(2).to_numpy(),
+                             "trend": pace.rolling(4, min_periods=1).mean().round(2).to_numpy(), "km": weekly["km"].round(1).to_numpy()})
+
+    def streaks(self, today=None):
+        if self.daily.empty: return {"current": 0, "longest": 0}
+        ran = self.daily.index[self.daily["runs"] > 0].normalize().unique().sort_values()
+        breaks = np.diff(ran.values.astype("datetime64[D]").astype(np.int64)) != 1
+        group = np.concatenate([[0], np.cumsum(breaks)])
+        lengths = np.bincount(group)
+        today = pd.Timestamp(today or date.today())
+        current = int(lengths[-1]) if (today - ran[-1]).days <= 1 else 0
+        return {"current": current, "longest": int(lengths.max())}
+
+    def summary(self, today=None):
+        mileage = self.mileage(today)
+        last = mileage.iloc[-1] if not mileage.empty else None
+        bests = self.bests.reindex([label for label, _ in DISTANCE_BRACKETS]).dropna(how="all").reset_index(names="bracket")
+        return {
+            "runs": self.count,
+            "acute_km": float(last["acute"]) if last is not None else 0.0,
+            "chronic_km": float(last["chronic"]) if last is not None else 0.0,
+            "acwr": None if last is None or pd.isna(last["acwr"]) else float(last["acwr"]),
+            "streaks": self.streaks(today),
+            "bests": bests,
+            "mileage": mileage.tail(365).rename_axis("date").reset_index(),
+            "weekly_pace": self.weekly_pace(),
+        }
+
+_states = {}
+_states_lock = threading.Lock()
+
+def _totals(user_id):
+    snapshot = database.get_local_snapshot()
+    if snapshot: return snapshot.run_totals()
+    with database.connect_db() as conn, conn.cursor() as cur:
+        cur.execute("SELECT count(*), COALESCE(MAX(id), 0) FROM biegi WHERE user_id = %s", (user_id,))
+        return cur.fetchone()
+
+def _fetch(user_id, after_id):
+    snapshot = database.get_local_snapshot()
+    if snapshot: return snapshot.runs_after(after_id)
+    query = "SELECT id, data, dystans, czas_min FROM biegi WHERE user_id = %s AND id > %s ORDER BY id"
+    with database.connect_db() as conn:
+        return pd.read_sql_query(query, conn, params=(user_id, after_id))
+
+def _sync(scope):
+    generation = database.run_generation()
+    user_id = database.current_user_id()
+    with _states_lock:
+        state = _states.get(scope)
+        if state is None or state.generation != generation:
+            state = _states[scope] = RunAnalytics(generation)
+        total, max_id = _totals(user_id)
+        if total < state.count or (max_id == state.last_id and total != state.count):
+            state = _states[scope] = RunAnalytics(generation)
+        if max_id > state.last_id or total != state.count:
+            state.update(_fetch(user_id, state.last_id))
+            state.count = total
+        return state
+
+@database.cached("runs")
+def get_running_analytics():
+    return _sync(database.cache_scope()).summary()
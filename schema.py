@@ -0,0 +1,317 @@
+MIGRATION_LOCK_ID = 872301
+CHANGE_CHANNEL = "training_panel_changes"
+
+DEFAULT_ACTIVITIES = [
+    ("Pushups", "Workouts", 0), ("Pullups", "Workouts", 0),
+    ("Pool (laps)", "Workouts", 0), ("Running (km)", "Workouts", 0), ("Running (pace)", "Workouts", 0),
+    ("Coffee", "Bad Habits", 1), ("Sweets", "Bad Habits", 1), ("Junk Food", "Bad Habits", 1), ("Alcohol", "Bad Habits", 1),
+    ("Sauna (min)", "Recovery", 0), ("Supplements", "Recovery", 0),
+    ("5", "Bouldering", 0), ("6A", "Bouldering", 0), ("6A+", "Bouldering", 0), ("6B", "Bouldering", 0), ("6C", "Bouldering", 0),
+    ("5", "Sport Climbing", 0), ("6a", "Sport Climbing", 0), ("6a+", "Sport Climbing", 0), ("6b", "Sport Climbing", 0)
+]
+
+LEGACY_WEEK_KEY_SQL = "EXTRACT(YEAR FROM {col})::int || '-' || EXTRACT(WEEK FROM {col})::int"
+WEEK_KEY_SQL = "(EXTRACT(ISOYEAR FROM {col})::int * 100 + EXTRACT(WEEK FROM {col})::int)"
+CALENDAR_START = "1990-01-01"
+CALENDAR_END = "2100-12-27"
+LOGI_PARTITIONS = 8
+
+def week_key(d):
+    iso_year, week, _ = d.isocalendar()
+    return iso_year * 100 + week
+
+def _merge_rollups(cur, source, tenant, where="", params=()):
+    group = "user_id, " if tenant == "user_id" else ""
+    cur.execute(f"""
+        INSERT INTO logi_dzien (user_id, data, aktywnosc, suma)
+        SELECT {tenant}, data, aktywnosc, SUM(ilosc) FROM {source} WHERE data IS NOT NULL{where} GROUP BY {group}data, aktywnosc
+        ON CONFLICT (user_id, data, aktywnosc) DO UPDATE SET suma = logi_dzien.suma + EXCLUDED.suma
+    """, params)
+    groups = cur.rowcount
+    cur.execute(f"""
+        INSERT INTO logi_tydzien (user_id, klucz_tygodnia, aktywnosc, suma)
+        SELECT {tenant}, week_key(data), aktywnosc, SUM(ilosc) FROM {source} WHERE data IS NOT NULL{where} GROUP BY {group}week_key(data), aktywnosc
+        ON CONFLICT (user_id, klucz_tygodnia, aktywnosc) DO UPDATE SET suma = logi_tydzien.suma + EXCLUDED.suma
+    """, params)
+    return groups
+
+def merge_rollups(cur, source, user_id=None):
+    if user_id is None: return _merge_rollups(cur, source, "user_id")
+    return _merge_rollups(cur, source, "%s", params=[user_id])
+
+def rebuild_rollups(cur, user_id=None):
+    if user_id is None:
+        cur.execute("DELETE FROM logi_dzien")
+        cur.execute("DELETE FROM logi_tydzien")
+        return merge_rollups(cur, "logi")
+    cur.execute("DELETE FROM logi_dzien WHERE user_id = %s", (user_id,))
+    cur.execute("DELETE FROM logi_tydzien WHERE user_id = %s", (user_id,))
+    return _merge_rollups(cur, "logi", "user_id", " AND user_id = %s", [user_id])
+
+def seed_tenant(cur, user_id):
+    cur.execute("INSERT INTO uzytkownicy (user_id) VALUES (%s) ON CONFLICT DO NOTHING", (user_id,))
+    if cur.rowcount != 1: return False
+    cur.executemany("INSERT INTO config_aktywnosci (user_id, nazwa, kategoria, czy_zly) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING",
+                    [(user_id, *row) for row in DEFAULT_ACTIVITIES])
+    return True
+
+def _untenanted_rebuild_rollups(cur):
+    cur.execute("DELETE FROM logi_dzien")
+    cur.execute("DELETE FROM logi_tydzien")
+    cur.execute("INSERT INTO logi_dzien (data, aktywnosc, suma) SELECT data, aktywnosc, SUM(ilosc) FROM logi WHERE data IS NOT NULL GROUP BY data, aktywnosc")
+    cur.execute("INSERT INTO logi_tydzien (klucz_tygodnia, aktywnosc, suma) SELECT week_key(data), aktywnosc, SUM(ilosc) FROM logi WHERE data IS NOT NULL GROUP BY 1, aktywnosc")
+
+def _base_tables(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS logi
+                    (id SERIAL PRIMARY KEY, data TEXT, aktywnosc TEXT, ilosc REAL)''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS cele
+                    (klucz_tygodnia TEXT, aktywnosc TEXT, wartosc REAL,
+                    PRIMARY KEY (klucz_tygodnia, aktywnosc))''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS config_aktywnosci
+                    (nazwa TEXT PRIMARY KEY, kategoria TEXT, czy_zly INTEGER)''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS biegi
+                    (id SERIAL PRIMARY KEY, data TEXT, dystans REAL, czas_min REAL, tempo_min_km REAL, notatka TEXT)''')
+
+    cur.execute("SELECT count(*) FROM config_aktywnosci")
+    if cur.fetchone()[0] == 0:
+        query = "INSERT INTO config_aktywnosci (nazwa, kategoria, czy_zly) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING"
+        cur.executemany(query, DEFAULT_ACTIVITIES)
+
+def _date_columns(cur):
+    for table in ("logi", "biegi"):
+        cur.execute(f"ALTER TABLE {table} ALTER COLUMN data TYPE DATE USING NULLIF(data::text, '')::date")
+
+def _week_key_function(cur):
+    cur.execute(f"""CREATE OR REPLACE FUNCTION week_key(d DATE) RETURNS TEXT
+                    LANGUAGE sql IMMUTABLE AS $$ SELECT {LEGACY_WEEK_KEY_SQL.format(col="d")} $$""")
+
+def _rollup_tables(cur):
+    cur.execute("DROP TABLE IF EXISTS logi_dzien")
+    cur.execute("DROP TABLE IF EXISTS logi_tydzien")
+    cur.execute('''CREATE TABLE logi_dzien
+                    (data DATE, aktywnosc TEXT, suma REAL, PRIMARY KEY (data, aktywnosc))''')
+    cur.execute('''CREATE TABLE logi_tydzien
+                    (klucz_tygodnia TEXT, aktywnosc TEXT, suma REAL, PRIMARY KEY (klucz_tygodnia, aktywnosc))''')
+    _untenanted_rebuild_rollups(cur)
+
+def _pg_rollup_tables(cur):
+    _week_key_function(cur)
+    _rollup_tables(cur)
+
+def _indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS logi_data_aktywnosc_idx ON logi (data, aktywnosc) INCLUDE (ilosc)")
+    cur.execute("CREATE INDEX IF NOT EXISTS biegi_data_id_idx ON biegi (data DESC, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS cele_aktywnosc_klucz_idx ON cele (aktywnosc, klucz_tygodnia) INCLUDE (wartosc)")
+
+def _sqlite_base_tables(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS logi
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, data DATE, aktywnosc TEXT, ilosc REAL)''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS cele
+                    (klucz_tygodnia TEXT, aktywnosc TEXT, wartosc REAL,
+                    PRIMARY KEY (klucz_tygodnia, aktywnosc))''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS config_aktywnosci
+                    (nazwa TEXT PRIMARY KEY, kategoria TEXT, czy_zly INTEGER)''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS biegi
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, data DATE, dystans REAL, czas_min REAL, tempo_min_km REAL, notatka TEXT)''')
+
+    cur.executemany("INSERT INTO config_aktywnosci (nazwa, kategoria, czy_zly) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING", DEFAULT_ACTIVITIES)
+
+def _calendar_table(cur, weeks_cte, week_end_sql):
+    cur.execute('''CREATE TABLE IF NOT EXISTS kalendarz_tygodni
+                    (klucz_tygodnia INTEGER PRIMARY KEY, rok_iso INTEGER, tydzien INTEGER, poczatek DATE, koniec DATE)''')
+    cur.execute(f"""{weeks_cte}
+        INSERT INTO kalendarz_tygodni (klucz_tygodnia, rok_iso, tydzien, poczatek, koniec)
+        SELECT week_key(d), week_key(d) / 100, week_key(d) % 100, d, {week_end_sql} FROM weeks WHERE true
+        ON CONFLICT DO NOTHING""")
+
+def _iso_goal_keys(cur, year_sql, week_sql, valid_sql):
+    cur.execute('''CREATE TABLE cele_iso
+                    (klucz_tygodnia INTEGER, aktywnosc TEXT, wartosc REAL,
+                    PRIMARY KEY (klucz_tygodnia, aktywnosc))''')
+    cur.execute(f"""
+        INSERT INTO cele_iso (klucz_tygodnia, aktywnosc, wartosc)
+        SELECT COALESCE(k.klucz_tygodnia, (s.rok - 1) * 100 + s.tydzien), s.aktywnosc, MAX(s.wartosc)
+        FROM (SELECT {year_sql} AS rok, {week_sql} AS tydzien, aktywnosc, wartosc FROM cele WHERE {valid_sql}) s
+        LEFT JOIN kalendarz_tygodni k ON k.klucz_tygodnia = s.rok * 100 + s.tydzien
+        GROUP BY 1, 2
+    """)
+    cur.execute("DROP TABLE cele")
+    cur.execute("ALTER TABLE cele_iso RENAME TO cele")
+
+def _iso_week_rollups(cur):
+    cur.execute("DROP TABLE IF EXISTS logi_tydzien")
+    cur.execute('''CREATE TABLE logi_tydzien
+                    (klucz_tygodnia INTEGER, aktywnosc TEXT, suma REAL, PRIMARY KEY (klucz_tygodnia, aktywnosc))''')
+    _untenanted_rebuild_rollups(cur)
+
+def _iso_week_keys(cur):
+    cur.execute("DROP FUNCTION IF EXISTS week_key(date)")
+    cur.execute(f"""CREATE FUNCTION week_key(d DATE) RETURNS INTEGER
+                    LANGUAGE sql IMMUTABLE AS $$ SELECT {WEEK_KEY_SQL.format(col="d")} $$""")
+    _calendar_table(cur, f"""WITH weeks AS (SELECT d::date AS d FROM generate_series(date '{CALENDAR_START}', date '{CALENDAR_END}', interval '7 days') d)""", "d + 6")
+    _iso_goal_keys(cur, "split_part(klucz_tygodnia, '-', 1)::int", "split_part(klucz_tygodnia, '-', 2)::int",
+                   "klucz_tygodnia ~ '^[0-9]+-[0-9]+$'")
+    cur.execute("ALTER INDEX cele_iso_pkey RENAME TO cele_pkey")
+    cur.execute("CREATE INDEX cele_aktywnosc_klucz_idx ON cele (aktywnosc, klucz_tygodnia) INCLUDE (wartosc)")
+    _iso_week_rollups(cur)
+
+def _sqlite_iso_week_keys(cur):
+    _calendar_table(cur, f"""WITH RECURSIVE weeks(d) AS (SELECT date('{CALENDAR_START}') UNION ALL
+                                                         SELECT date(d, '+7 days') FROM weeks WHERE d < '{CALENDAR_END}')""",
+                    "date(d, '+6 days')")
+    _iso_goal_keys(cur, "CAST(substr(klucz_tygodnia, 1, instr(klucz_tygodnia, '-') - 1) AS INTEGER)",
+                   "CAST(substr(klucz_tygodnia, instr(klucz_tygodnia, '-') + 1) AS INTEGER)",
+                   "klucz_tygodnia GLOB '[0-9]*-[0-9]*'")
+    cur.execute("CREATE INDEX cele_aktywnosc_klucz_idx ON cele (aktywnosc, klucz_tygodnia, wartosc)")
+    _iso_week_rollups(cur)
+
+def _sqlite_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS logi_data_aktywnosc_idx ON logi (data, aktywnosc, ilosc)")
+    cur.execute("CREATE INDEX IF NOT EXISTS biegi_data_id_idx ON biegi (data DESC, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS cele_aktywnosc_klucz_idx ON cele (aktywnosc, klucz_tygodnia, wartosc)")
+
+def _tenant_registry(cur):
+    cur.execute("CREATE TABLE IF NOT EXISTS uzytkownicy (user_id TEXT PRIMARY KEY)")
+    cur.execute("INSERT INTO uzytkownicy (user_id) VALUES ('') ON CONFLICT DO NOTHING")
+
+def _tenant_rollups(cur):
+    cur.execute("DROP TABLE IF EXISTS logi_dzien")
+    cur.execute("DROP TABLE IF EXISTS logi_tydzien")
+    cur.execute('''CREATE TABLE logi_dzien
+                    (user_id TEXT NOT NULL DEFAULT '', data DATE, aktywnosc TEXT, suma REAL,
+                    PRIMARY KEY (user_id, data, aktywnosc))''')
+    cur.execute('''CREATE TABLE logi_tydzien
+                    (user_id TEXT NOT NULL DEFAULT '', klucz_tygodnia INTEGER, aktywnosc TEXT, suma REAL,
+                    PRIMARY KEY (user_id, klucz_tygodnia, aktywnosc))''')
+    rebuild_rollups(cur)
+
+def _partitioned_logi(cur):
+    cur.execute("ALTER TABLE logi RENAME TO logi_stare")
+    cur.execute("ALTER SEQUENCE logi_id_seq OWNED BY NONE")
+    cur.execute('''CREATE TABLE logi
+                    (id INTEGER NOT NULL DEFAULT nextval('logi_id_seq'), user_id TEXT NOT NULL DEFAULT '',
+                    data DATE, aktywnosc TEXT, ilosc REAL, PRIMARY KEY (user_id, id)) PARTITION BY HASH (user_id)''')
+    for i in range(LOGI_PARTITIONS):
+        cur.execute(f"CREATE TABLE logi_p{i} PARTITION OF logi FOR VALUES WITH (MODULUS {LOGI_PARTITIONS}, REMAINDER {i})")
+    cur.execute("INSERT INTO logi (id, data, aktywnosc, ilosc) SELECT id, data, aktywnosc, ilosc FROM logi_stare")
+    cur.execute("DROP TABLE logi_stare")
+    cur.execute("ALTER SEQUENCE logi_id_seq OWNED BY logi.id")
+    cur.execute("CREATE INDEX logi_user_data_aktywnosc_idx ON logi (user_id, data, aktywnosc) INCLUDE (ilosc)")
+    cur.execute("ANALYZE logi")
+
+def _tenants(cur):
+    _tenant_registry(cur)
+    for table, key in (("config_aktywnosci", "nazwa"), ("cele", "klucz_tygodnia, aktywnosc")):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN user_id TEXT NOT NULL DEFAULT ''")
+        cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_pkey, ADD PRIMARY KEY (user_id, {key})")
+    cur.execute("DROP INDEX IF EXISTS cele_aktywnosc_klucz_idx")
+    cur.execute("CREATE INDEX cele_user_aktywnosc_klucz_idx ON cele (user_id, aktywnosc, klucz_tygodnia) INCLUDE (wartosc)")
+    cur.execute("ALTER TABLE biegi ADD COLUMN user_id TEXT NOT NULL DEFAULT ''")
+    cur.execute("DROP INDEX IF EXISTS biegi_data_id_idx")
+    cur.execute("CREATE INDEX biegi_user_data_id_idx ON biegi (user_id, data DESC, id DESC)")
+    _partitioned_logi(cur)
+    _tenant_rollups(cur)
+
+def _sqlite_tenant_key(cur, table, columns, key):
+    names = ", ".join(column.split()[0] for column in columns.split(", "))
+    cur.execute(f"CREATE TABLE {table}_t (user_id TEXT NOT NULL DEFAULT '', {columns}, PRIMARY KEY (user_id, {key}))")
+    cur.execute(f"INSERT INTO {table}_t ({names}) SELECT {names} FROM {table}")
+    cur.execute(f"DROP TABLE {table}")
+    cur.execute(f"ALTER TABLE {table}_t RENAME TO {table}")
+
+def _sqlite_tenants(cur):
+    _tenant_registry(cur)
+    _sqlite_tenant_key(cur, "config_aktywnosci", "nazwa TEXT, kategoria TEXT, czy_zly INTEGER", "nazwa")
+    _sqlite_tenant_key(cur, "cele", "klucz_tygodnia INTEGER, aktywnosc TEXT, wartosc REAL", "klucz_tygodnia, aktywnosc")
+    cur.execute("CREATE INDEX cele_user_aktywnosc_klucz_idx ON cele (user_id, aktywnosc, klucz_tygodnia, wartosc)")
+    for table in ("logi", "biegi"):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN user_id TEXT NOT NULL DEFAULT ''")
+        cur.execute(f"CREATE INDEX {table}_user_id_idx ON {table} (user_id, id)")
+    cur.execute("DROP INDEX IF EXISTS logi_data_aktywnosc_idx")
+    cur.execute("CREATE INDEX logi_user_data_aktywnosc_idx ON logi (user_id, data, aktywnosc, ilosc)")
+    cur.execute("DROP INDEX IF EXISTS biegi_data_id_idx")
+    cur.execute("CREATE INDEX biegi_user_data_id_idx ON biegi (user_id, data DESC, id DESC)")
+    _tenant_rollups(cur)
+
+def _log_archive(cur, timestamp_sql):
+    cur.execute(f'''CREATE TABLE IF NOT EXISTS logi_archiwum
+                    (user_id TEXT NOT NULL DEFAULT '', id INTEGER NOT NULL, data DATE, aktywnosc TEXT, ilosc REAL,
+                    scalony_do INTEGER NOT NULL, scalono_at {timestamp_sql}, PRIMARY KEY (user_id, id))''')
+    cur.execute("CREATE INDEX IF NOT EXISTS logi_archiwum_scalony_do_idx ON logi_archiwum (user_id, scalony_do)")
+
+def _pg_log_archive(cur):
+    _log_archive(cur, "TIMESTAMPTZ DEFAULT now()")
+
+def _sqlite_log_archive(cur):
+    _log_archive(cur, "TEXT DEFAULT CURRENT_TIMESTAMP")
+
+def _row_versions(cur):
+    for table in ("biegi", "config_aktywnosci", "cele"):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN wersja INTEGER NOT NULL DEFAULT 1")
+
+def _change_notifications(cur):
+    cur.execute(f"""CREATE OR REPLACE FUNCTION notify_change() RETURNS trigger LANGUAGE plpgsql AS $$
+                    BEGIN
+                        PERFORM pg_notify('{CHANGE_CHANNEL}', TG_TABLE_NAME || ':' || user_id) FROM (SELECT DISTINCT user_id FROM changed) c;
+                        RETURN NULL;
+                    END $$""")
+    for table in ("logi", "biegi", "cele", "config_aktywnosci"):
+        for event, rows in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+            cur.execute(f"""CREATE TRIGGER {table}_notify_{event} AFTER {event.upper()} ON {table}
+                            REFERENCING {rows} TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION notify_change()""")
+
+def _change_notification_ops(cur):
+    cur.execute(f"""CREATE OR REPLACE FUNCTION notify_change() RETURNS trigger LANGUAGE plpgsql AS $$
+                    BEGIN
+                        PERFORM pg_notify('{CHANGE_CHANNEL}', TG_TABLE_NAME || ':' || lower(TG_OP) || ':' || user_id)
+                        FROM (SELECT DISTINCT user_id FROM changed) c;
+                        RETURN NULL;
+                    END $$""")
+
+def _write_journals(cur):
+    cur.execute("CREATE TABLE kolejka_zapisow (dziennik TEXT PRIMARY KEY, ostatni_id BIGINT NOT NULL DEFAULT 0)")
+
+def _noop(cur):
+    pass
+
+MIGRATIONS = [
+    (1, "base tables and default activities", {"postgres": _base_tables, "sqlite": _sqlite_base_tables}),
+    (2, "DATE columns on logi and biegi", {"postgres": _date_columns, "sqlite": _noop}),
+    (3, "daily and weekly logi rollups", {"postgres": _pg_rollup_tables, "sqlite": _rollup_tables}),
+    (4, "covering indexes for date and goal lookups", {"postgres": _indexes, "sqlite": _sqlite_indexes}),
+    (5, "week_key() SQL function", {"postgres": _week_key_function, "sqlite": _noop}),
+    (6, "integer ISO year-week keys and week calendar", {"postgres": _iso_week_keys, "sqlite": _sqlite_iso_week_keys}),
+    (7, "user_id tenant keys and hash-partitioned logi", {"postgres": _tenants, "sqlite": _sqlite_tenants}),
+    (8, "logi_archiwum audit trail for compacted log rows", {"postgres": _pg_log_archive, "sqlite": _sqlite_log_archive}),
+    (9, "wersja row versions on biegi, config_aktywnosci and cele", {"postgres": _row_versions, "sqlite": _row_versions}),
+    (10, "pg_notify change triggers on logi, biegi, cele and config_aktywnosci", {"postgres": _change_notifications, "sqlite": _noop}),
+    (11, "kolejka_zapisow last applied id per write-queue journal", {"postgres": _write_journals, "sqlite": _write_journals}),
+    (12, "operation in pg_notify change payloads", {"postgres": _change_notification_ops, "sqlite": _noop}),
+]
+
+def migrate(conn, dialect="postgres"):
+    applied = []
+    with conn.cursor() as cur:
+        if dialect == "postgres":
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            cur.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                            (version INTEGER PRIMARY KEY, nazwa TEXT, applied_at TIMESTAMPTZ DEFAULT now())''')
+        else:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                            (version INTEGER PRIMARY KEY, nazwa TEXT, applied_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        current = cur.fetchone()[0]
+        for version, name, steps in MIGRATIONS:
+            if version <= current: continue
+            steps[dialect](cur)
+            cur.execute("INSERT INTO schema_version (version, nazwa) VALUES (%s, %s)", (version, name))
+            applied.append(version)
+    conn.commit()
+    return applied
@@ -0,0 +1,216 @@
+import csv
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import psycopg2
+from psycopg2.extras import execute_values
+import instrumentation
+import schema
+from db_pool import get_pool
+
+SQLITE_PREFIX = "sqlite:///"
+COPY_BATCH = 1000
+
+class PostgresBackend:
+    name = "postgres"
+    Error = psycopg2.Error
+
+    def __init__(self, db_url):
+        self.db_url = db_url
+        self.pool = get_pool(db_url, connection_factory=instrumentation.TracingConnection)
+
+    def connection(self):
+        return self.pool.connection()
+
+    def migrate(self, conn):
+        return schema.migrate(conn, self.name)
+
+    @staticmethod
+    def date_bucket(bucket, col):
+        if bucket == "day": return col
+        return f"date_trunc('{bucket}', {col})::date"
+
+    @staticmethod
+    def execute_values(cur, sql, rows, template=None):
+        execute_values(cur, sql, rows, template=template, page_size=COPY_BATCH)
+
+    @staticmethod
+    def update_rows(cur, table, keys, columns, types, rows):
+        assignments = ", ".join(f"{col} = v.{col}" for col in columns)
+        template = "(" + ", ".join(f"%s::{t}" for t in types) + ")"
+        match = " AND ".join(f"{table}.{key} = v.{key}" for key in keys)
+        execute_values(cur, f"""
+            UPDATE {table} SET {assignments}
+            FROM (VALUES %s) AS v({", ".join(list(keys) + list(columns))})
+            WHERE {match}
+        """, rows, template=template, page_size=COPY_BATCH)
+
+    @staticmethod
+    def create_staging(cur, table, columns):
+        cur.execute(f"CREATE TEMP TABLE {table} ({columns}) ON COMMIT DROP")
+
+    @staticmethod
+    def copy_in(cur, table, columns, stream, header=True):
+        options = "FORMAT csv, HEADER true" if header else "FORMAT csv"
+        cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH ({options})", stream)
+
+    @staticmethod
+    def copy_out(cur, query, out, params=None):
+        if params: query = cur.mogrify(query, params).decode()
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", out)
+
+    @staticmethod
+    def truncate(cur, tables):
+        cur.execute(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY")
+
+def bucket_start(d, bucket):
+    if bucket == "week": return d - timedelta(days=d.weekday())
+    if bucket == "month": return d.replace(day=1)
+    if bucket == "year": return d.replace(month=1, day=1)
+    return d
+
+def _sqlite_date_trunc(bucket, value):
+    if value is None: return None
+    return bucket_start(date.fromisoformat(str(value)[:10]), bucket).isoformat()
+
+def _sqlite_week_key(value):
+    if value is None: return None
+    return schema.week_key(date.fromisoformat(str(value)[:10]))
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, datetime.isoformat)
+sqlite3.register_converter("DATE", lambda raw: date.fromisoformat(raw.decode()[:10]))
+
+class SqliteCursor(sqlite3.Cursor):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @instrumentation.timed_statement
+    def execute(self, sql, params=()):
+        return super().execute(sql.replace("%s", "?"), tuple(params or ()))
+
+    @instrumentation.timed_statement
+    def executemany(self, sql, seq_of_params):
+        return super().executemany(sql.replace("%s", "?"), seq_of_params)
+
+class SqliteConnection(sqlite3.Connection):
+    def cursor(self, factory=SqliteCursor):
+        return super().cursor(factory)
+
+    @property
+    def closed(self):
+        try:
+            self.total_changes
+            return 0
+        except sqlite3.ProgrammingError:
+            return 1
+
+class SqliteBackend:
+    name = "sqlite"
+    Error = sqlite3.Error
+
+    def __init__(self, db_url):
+        self.db_url = db_url
+        self.path = db_url[len(SQLITE_PREFIX):]
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False, factory=SqliteConnection)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.create_function("date_trunc", 2, _sqlite_date_trunc, deterministic=True)
+        conn.create_function("week_key", 1, _sqlite_week_key, deterministic=True)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        conn = conn or self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction: conn.rollback()
+            with self._lock:
+                self._idle.append(conn)
+
+    def migrate(self, conn):
+        return schema.migrate(conn, self.name)
+
+    @staticmethod
+    def date_bucket(bucket, col):
+        if bucket == "day": return col
+        return f"date_trunc('{bucket}', {col})"
+
+    @staticmethod
+    def execute_values(cur, sql, rows, template=None):
+        rows = list(rows)
+        if not rows: return
+        width = len(rows[0])
+        placeholders = "(" + ", ".join("?" for _ in range(width)) + ")"
+        for i in range(0, len(rows), COPY_BATCH):
+            batch = rows[i:i + COPY_BATCH]
+            values = ", ".join(placeholders for _ in batch)
+            cur.execute(sql.replace("VALUES %s", f"VALUES {values}"), [v for row in batch for v in row])
+
+    @staticmethod
+    def update_rows(cur, table, keys, columns, types, rows):
+        assignments = ", ".join(f"{col} = ?" for col in columns)
+        match = " AND ".join(f"{key} = ?" for key in keys)
+        n = len(keys)
+        cur.executemany(f"UPDATE {table} SET {assignments} WHERE {match}", [tuple(row[n:]) + tuple(row[:n]) for row in rows])
+
+    @staticmethod
+    def create_staging(cur, table, columns):
+        cur.execute(f"DROP TABLE IF EXISTS temp.{table}")
+        cur.execute(f"CREATE TEMP TABLE {table} ({columns})")
+
+    @staticmethod
+    def copy_in(cur, table, columns, stream, header=True):
+        reader = csv.reader(stream)
+        if header: next(reader, None)
+        width = len(columns.split(","))
+        sql = f"INSERT INTO {table} ({columns}) VALUES ({', '.join('?' for _ in range(width))})"
+        batch = []
+        for row in reader:
+            batch.append([value if value != "" else None for value in row])
+            if len(batch) >= COPY_BATCH:
+                cur.executemany(sql, batch)
+                batch = []
+        if batch: cur.executemany(sql, batch)
+
+    @staticmethod
+    def copy_out(cur, query, out, params=None):
+        cur.execute(query, params or ())
+        writer = csv.writer(out)
+        writer.writerow([col[0] for col in cur.description])
+        while True:
+            rows = cur.fetchmany(COPY_BATCH)
+            if not rows: break
+            writer.writerows(rows)
+
+    @staticmethod
+    def truncate(cur, tables):
+        for table in tables:
+            cur.execute(f"DELETE FROM {table}")
+
+def for_cursor(cur):
+    return SqliteBackend if isinstance(cur, sqlite3.Cursor) else PostgresBackend
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_backend(db_url):
+    with _backends_lock:
+        backend = _backends.get(db_url)
+        if backend is None:
+            backend_class = SqliteBackend if db_url.startswith(SQLITE_PREFIX) else PostgresBackend
+            backend = _backends[db_url] = backend_class(db_url)
+    return backend
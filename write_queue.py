@@ -0,0 +1,97 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+QUEUE_DIR = ".write_queue"
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH = 500
+MAX_BACKOFF = 60.0
+
+def journal_path(scope, directory=QUEUE_DIR):
+    return os.path.join(directory, f"{hashlib.sha1(scope.encode()).hexdigest()[:16]}.sqlite")
+
+class WriteQueue:
+    def __init__(self, scope, flush, flushed=None, directory=QUEUE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = journal_path(scope, directory)
+        name = os.path.basename(self.path)[:-len(".sqlite")]
+        self._flush = flush
+        self._flushed = flushed
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute('''CREATE TABLE IF NOT EXISTS pending
+                            (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT, aktywnosc TEXT, ilosc REAL)''')
+        # Random per-file identity; the flush callback records the last applied id under it so a
+        # batch committed just before a crash is skipped when the same rows are flushed again.
+        self._db.execute("CREATE TABLE IF NOT EXISTS dziennik (id TEXT)")
+        self._db.execute("INSERT INTO dziennik SELECT ? WHERE NOT EXISTS (SELECT 1 FROM dziennik)", (uuid.uuid4().hex,))
+        self.journal_id = self._db.execute("SELECT id FROM dziennik").fetchone()[0]
+        self.last_flush = None
+        self.last_error = None
+        self._worker = threading.Thread(target=self._run, name=f"write-queue-{name}", daemon=True)
+        self._worker.start()
+
+    def enqueue(self, day, activity, amount):
+        with self._lock:
+            self._db.execute("INSERT INTO pending (data, aktywnosc, ilosc) VALUES (?, ?, ?)", (str(day), activity, amount))
+
+    def pending(self):
+        with self._lock:
+            return self._db.execute("SELECT data, aktywnosc, ilosc FROM pending ORDER BY id").fetchall()
+
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM pending").fetchone()[0]
+
+    def pop_last(self):
+        with self._flush_lock, self._lock:
+            row = self._db.execute("SELECT id, data, aktywnosc, ilosc FROM pending ORDER BY id DESC LIMIT 1").fetchone()
+            if row: self._db.execute("DELETE FROM pending WHERE id = ?", (row[0],))
+        return row[1:] if row else None
+
+    def flush(self):
+        flushed = 0
+        while True:
+            with self._flush_lock:
+                with self._lock:
+                    rows = self._db.execute("SELECT id, data, aktywnosc, ilosc FROM pending ORDER BY id LIMIT ?", (FLUSH_BATCH,)).fetchall()
+                if not rows: break
+                self._flush(self.journal_id, rows)
+                with self._lock:
+                    self._db.execute("DELETE FROM pending WHERE id <= ?", (rows[-1][0],))
+            flushed += len(rows)
+            if self._flushed: self._flushed()
+        self.last_flush = time.time()
+        self.last_error = None
+        return flushed
+
+    def _run(self):
+        delay = FLUSH_INTERVAL
+        while True:
+            time.sleep(delay)
+            try:
+                self.flush()
+                delay = FLUSH_INTERVAL
+            except Exception as e:
+                self.last_error = str(e)
+                delay = min(delay * 2, MAX_BACKOFF)
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+def peek_queue(scope):
+    with _queues_lock:
+        return _queues.get(scope)
+
+def get_queue(scope, flush, flushed=None):
+    with _queues_lock:
+        queue = _queues.get(scope)
+        if queue is None:
+            queue = _queues[scope] = WriteQueue(scope, flush, flushed)
+    return queue